@@ -5,14 +5,235 @@
 
 import bpy 
 
+import numpy as np
+
 from ..__init__ import get_addon_prefs
+from ..utils.profiler_utils import profiled, profiled_node
 from ..utils.str_utils import word_wrap
-from ..utils.node_utils import create_new_nodegroup, set_socket_defvalue
+from ..utils.registry_utils import register_instance, unregister_instance, get_all_instances
+from ..utils.node_utils import create_new_nodegroup, set_socket_defvalue, create_socket
+
+
+#NOTE Each node internal tree keeps a snapshot of the camera state it last wrote, so only the changed sockets are written.
+#     Writing a socket tags the nodetree dirty and triggers a re-evaluation of the geometry, even if the value is identical.
+#     The camera object is stored by pointer, python references to IDs may dangle after an undo.
+#     The nodes using the active scene camera all share the same internal tree, updated once. A node gets its own copy
+#     of the tree only when switching to a specific camera object (copy on write).
+
+CAMERA_SNAPSHOTS = {}                 #{node_tree.session_uid: snapshot tuple, see evaluate_camera()}
+
+CAMERA_OUTPUTS = {
+    "Camera Object" : "NodeSocketObject",
+    "Field of View" : "NodeSocketFloat",
+    "Shift X" : "NodeSocketFloat",
+    "Shift Y" : "NodeSocketFloat",
+    "Clip Start" : "NodeSocketFloat",
+    "Clip End" : "NodeSocketFloat",
+    "Resolution X" : "NodeSocketInt",
+    "Resolution Y" : "NodeSocketInt",
+    "World Matrix" : "NodeSocketMatrix",
+    "Projection Matrix" : "NodeSocketMatrix",
+    "Frustum Planes A" : "NodeSocketMatrix",
+    "Frustum Planes B" : "NodeSocketMatrix",
+    }
+
+#signs of the clip space rows combined with the last row, to extract the left, right, bottom, top, near & far planes
+FRUSTUM_ROWS = np.array([0, 0, 1, 1, 2, 2])
+FRUSTUM_SIGNS = np.array([1.0, -1.0, 1.0, -1.0, 1.0, -1.0])[:,None]
+
+
+#NOTE Many nodes usually point to the same active camera. Within a handler invocation, each camera is evaluated once
+#     and its values are fanned out to all the nodes referencing it. Outside of an opened cache, nodes evaluate directly,
+#     as blender may call node.update() at any time.
+
+CAMERA_CACHE = {'depth':0, 'values':{},}   #values: {(scene pointer, camera pointer): snapshot tuple}
+
+
+def open_camera_cache():
+    """start caching the camera evaluations, to be closed by close_camera_cache(). can be nested"""
+
+    CAMERA_CACHE['depth'] += 1
+    return None
+
+
+def close_camera_cache():
+    """stop caching the camera evaluations, forget them when the outermost cache is closed"""
+
+    CAMERA_CACHE['depth'] = max(0, CAMERA_CACHE['depth']-1)
+    if (CAMERA_CACHE['depth']==0):
+        CAMERA_CACHE['values'].clear()
+
+    return None
+
+
+def get_camera_evaluation(scene, cam_obj,):
+    """evaluate the camera once per opened cache, see evaluate_camera()"""
+
+    if (CAMERA_CACHE['depth']==0):
+        return evaluate_camera(scene, cam_obj)
+
+    key = (scene.as_pointer(), cam_obj.as_pointer() if (cam_obj is not None) else 0)
+    snapshot = CAMERA_CACHE['values'].get(key)
+    if (snapshot is None):
+        snapshot = CAMERA_CACHE['values'][key] = evaluate_camera(scene, cam_obj)
+
+    return snapshot
+
+
+def ensure_camera_outputs(ng):
+    """create the outputs missing from nodetrees created by older versions of this node"""
+
+    current = [s.name for s in ng.nodes["Group Output"].inputs if (s.type!='CUSTOM')]
+
+    for socket_name, socket_type in list(CAMERA_OUTPUTS.items())[len(current):]:
+        create_socket(ng, in_out='OUTPUT', socket_type=socket_type, socket_name=socket_name,)
+
+    return None
+
+
+def get_camera_tree(bl_idname, shared=False,):
+    """get a new copy of the camera info nodetree, or the tree shared by all the nodes using the active scene camera"""
+
+    if (shared):
+        ng = bpy.data.node_groups.get(f".{bl_idname}.ActiveCamera")
+        if (ng is not None):
+            return ng
+
+    name = f".{bl_idname}"
+    ng = bpy.data.node_groups.get(name)
+    if (ng is None):
+        ng = create_new_nodegroup(name, out_sockets=CAMERA_OUTPUTS,)
+    ensure_camera_outputs(ng)
+
+    ng = ng.copy() #always using a copy of the original ng
+    if (shared):
+        ng.name = f".{bl_idname}.ActiveCamera"
+
+    return ng
+
+
+def get_output_identifiers(ng):
+    """get the identifiers of the outputs of a nodetree, the links of a group node are kept if they match"""
+
+    return [s.identifier for s in ng.nodes["Group Output"].inputs if (s.type!='CUSTOM')]
+
+
+def clear_camera_snapshots():
+    """forget the last written states, all sockets will be written on next update"""
+
+    CAMERA_SNAPSHOTS.clear()
+    return None
+
+
+def get_projection_matrix(cam, scene,):
+    """compute the projection matrix of a camera data for the scene render settings, same as blender viewplane.
+    we don't use 'Object.calc_matrix_camera()' as it needs an evaluated depsgraph, not available from our handlers"""
+
+    render = scene.render
+    winx, winy = render.resolution_x, render.resolution_y
+    ycor = render.pixel_aspect_y / render.pixel_aspect_x
+
+    sensor_fit = cam.sensor_fit
+    if (sensor_fit=='AUTO'):
+        sensor_size = cam.sensor_width
+        sensor_fit = 'HORIZONTAL' if (winx*render.pixel_aspect_x >= winy*render.pixel_aspect_y) else 'VERTICAL'
+    elif (sensor_fit=='HORIZONTAL'):
+          sensor_size = cam.sensor_width
+    else: sensor_size = cam.sensor_height
+
+    near, far = cam.clip_start, cam.clip_end
+    is_ortho = (cam.type=='ORTHO')
+    pixsize = cam.ortho_scale if (is_ortho) else (sensor_size * near / cam.lens)
+
+    viewfac = winx if (sensor_fit=='HORIZONTAL') else (ycor * winy)
+    pixsize /= viewfac
+
+    dx = cam.shift_x * viewfac
+    dy = cam.shift_y * viewfac
+    left, right = (-0.5*winx + dx) * pixsize, (0.5*winx + dx) * pixsize
+    bottom, top = (-0.5*ycor*winy + dy) * pixsize, (0.5*ycor*winy + dy) * pixsize
+
+    m = np.zeros((4,4), dtype=np.float64)
+    if (is_ortho):
+        m[0,0] = 2 / (right-left)
+        m[0,3] = -(right+left) / (right-left)
+        m[1,1] = 2 / (top-bottom)
+        m[1,3] = -(top+bottom) / (top-bottom)
+        m[2,2] = -2 / (far-near)
+        m[2,3] = -(far+near) / (far-near)
+        m[3,3] = 1
+    else:
+        m[0,0] = 2*near / (right-left)
+        m[0,2] = (right+left) / (right-left)
+        m[1,1] = 2*near / (top-bottom)
+        m[1,2] = (top+bottom) / (top-bottom)
+        m[2,2] = -(far+near) / (far-near)
+        m[2,3] = -2*far*near / (far-near)
+        m[3,2] = -1
+
+    return m
+
+
+def get_frustum_planes(viewproj,):
+    """extract the six normalized world space frustum planes (a,b,c,d), ax+by+cz+d>=0 inside.
+    in order left, right, bottom, top, near, far"""
+
+    planes = viewproj[3] + FRUSTUM_SIGNS * viewproj[FRUSTUM_ROWS]
+
+    #degenerated planes, ex: camera scaled to zero, are left as is
+    norms = np.linalg.norm(planes[:,:3], axis=1)
+    valid = (norms>1e-12)
+    planes[valid] /= norms[valid,None]
+
+    return planes
+
+
+def as_socket_matrix(m,):
+    """convert a row major 4x4 array to a hashable value for set_socket_defvalue(), which expects columns"""
+
+    return tuple(tuple(float(v) for v in col) for col in np.asarray(m).T)
+
+
+def evaluate_camera(scene, cam_obj,):
+    """get a compact tuple of the camera state written in the outputs, the camera object is stored by pointer.
+    the two frustum matrices pack three planes per row, 'Transform Point' gives the signed distances to them"""
+
+    if (cam_obj is None):
+        return (0,)
+
+    if (cam_obj.type!='CAMERA'):
+        return (cam_obj.as_pointer(),)
+
+    cam = cam_obj.data
+    world = np.array(cam_obj.matrix_world, dtype=np.float64)
+    projection = get_projection_matrix(cam, scene)
+    #the pseudo inverse won't raise on singular matrices, ex: camera scaled to zero to hide it
+    planes = get_frustum_planes(projection @ np.linalg.pinv(world))
+
+    identity_row = np.array([[0.0, 0.0, 0.0, 1.0]])
+    planes_a = np.vstack((planes[0:3], identity_row))
+    planes_b = np.vstack((planes[3:6], identity_row))
+
+    return (
+        cam_obj.as_pointer(),
+        cam.angle,
+        cam.shift_x,
+        cam.shift_y,
+        cam.clip_start,
+        cam.clip_end,
+        scene.render.resolution_x,
+        scene.render.resolution_y,
+        as_socket_matrix(world),
+        as_socket_matrix(projection),
+        as_socket_matrix(planes_a),
+        as_socket_matrix(planes_b),
+        )
 
 
 class NODEBOOSTER_NG_camerainfo(bpy.types.GeometryNodeCustomGroup):
     """Custom Nodgroup: Gather informations about any camera.
     • By default the camera will always use the active camera.
+    • Outputs the world & projection matrices, and the frustum planes packed in two matrices: left/right/bottom & top/near/far. Use 'Transform Point' to get the signed distances to three planes at once, positive inside.
     • Expect updates on each depsgraph post and frame_pre update signals"""
 
     bl_idname = "GeometryNodeNodeBoosterCameraInfo"
@@ -22,6 +243,7 @@ class NODEBOOSTER_NG_camerainfo(bpy.types.GeometryNodeCustomGroup):
         default=True,
         name="Use Active Camera",
         description="Automatically update the pointer to the active scene camera",
+        update=lambda self, context: self.swap_node_tree(),
         )
 
     def camera_obj_poll(self, obj):
@@ -40,55 +262,93 @@ class NODEBOOSTER_NG_camerainfo(bpy.types.GeometryNodeCustomGroup):
     def init(self, context):
         """this fct run when appending the node for the first time"""
 
-        name = f".{self.bl_idname}"
-
-        ng = bpy.data.node_groups.get(name)
-        if (ng is None):
-            ng = create_new_nodegroup(name,
-                out_sockets={
-                    "Camera Object" : "NodeSocketObject",
-                    "Field of View" : "NodeSocketFloat",
-                    "Shift X" : "NodeSocketFloat",
-                    "Shift Y" : "NodeSocketFloat",
-                    "Clip Start" : "NodeSocketFloat",
-                    "Clip End" : "NodeSocketFloat",
-                    "Resolution X" : "NodeSocketInt",
-                    "Resolution Y" : "NodeSocketInt",
-                },
-            )
-         
-        ng = ng.copy() #always using a copy of the original ng
-        
-        self.node_tree = ng
+        self.node_tree = get_camera_tree(self.bl_idname, shared=self.use_scene_cam,)
         self.label = self.bl_label
 
+        register_instance(self)
+
         return None
 
     def copy(self, node):
         """fct run when dupplicating the node"""
         
-        self.node_tree = node.node_tree.copy()
+        #the nodes using the active camera share the same tree
+        if (not self.use_scene_cam):
+            self.node_tree = node.node_tree.copy()
+        register_instance(self)
         
         return None
 
+    def free(self):
+        """when user delete the node we need to clean up"""
+
+        unregister_instance(self)
+
+        return None
+
     def update(self):
         """generic update function"""
 
         scene = bpy.context.scene
         cam_obj = scene.camera if (self.use_scene_cam) else self.camera_obj
-        set_socket_defvalue(self.node_tree, 0, value=cam_obj)
-        
-        if (cam_obj and cam_obj.data):
-            set_socket_defvalue(self.node_tree, 1, value=cam_obj.data.angle)
-            set_socket_defvalue(self.node_tree, 2, value=cam_obj.data.shift_x)
-            set_socket_defvalue(self.node_tree, 3, value=cam_obj.data.shift_y)
-            set_socket_defvalue(self.node_tree, 4, value=cam_obj.data.clip_start)
-            set_socket_defvalue(self.node_tree, 5, value=cam_obj.data.clip_end)
-            set_socket_defvalue(self.node_tree, 6, value=scene.render.resolution_x)
-            set_socket_defvalue(self.node_tree, 7, value=scene.render.resolution_y)
+
+        snapshot = get_camera_evaluation(scene, cam_obj)
+        key = self.node_tree.session_uid
+        previous = CAMERA_SNAPSHOTS.get(key)
+
+        #nothing changed since our last write
+        if (previous==snapshot):
+            return None
+
+        #nodetrees created before the matrices outputs were introduced
+        if (previous is None):
+            ensure_camera_outputs(self.node_tree)
+
+        if (previous is None) or (previous[0]!=snapshot[0]):
+            set_socket_defvalue(self.node_tree, 0, value=cam_obj)
+
+        for i,value in enumerate(snapshot[1:], start=1):
+            if (previous is None) or (i>=len(previous)) or (previous[i]!=value):
+                set_socket_defvalue(self.node_tree, i, value=value)
+            continue
+
+        CAMERA_SNAPSHOTS[key] = snapshot
+
+        return None
+
+    def swap_node_tree(self):
+        """use the shared tree in active camera mode, else our own copy of it"""
+
+        old = self.node_tree
+        shared = get_camera_tree(self.bl_idname, shared=True,)
+
+        if (self.use_scene_cam):
+              self.node_tree = shared
+        else: self.node_tree = shared.copy()
+
+        #no need to keep the old tree if nobody else use it
+        if (old is not None) and (old!=shared) and (old.users==0):
+            CAMERA_SNAPSHOTS.pop(old.session_uid, None)
+            bpy.data.node_groups.remove(old)
+
+        self.update()
 
         return None
 
+    def get_dependencies(self):
+        """get the IDs this node values depends on"""
+
+        scene = bpy.context.scene
+        cam_obj = scene.camera if (self.use_scene_cam) else self.camera_obj
+
+        dependencies = {scene}
+        if (cam_obj):
+            dependencies.add(cam_obj)
+            if (cam_obj.data):
+                dependencies.add(cam_obj.data)
+
+        return dependencies
+
     def draw_label(self,):
         """node label"""
         
@@ -109,12 +369,49 @@ class NODEBOOSTER_NG_camerainfo(bpy.types.GeometryNodeCustomGroup):
 
         return None
         
+    @profiled_node
+    def refresh(self):
+        """re-evaluate the node outputs, called from our handlers"""
+
+        #nodes created before the shared tree was introduced, adopt it if the links can be kept
+        if (self.use_scene_cam and self.node_tree.name!=f".{self.bl_idname}.ActiveCamera"):
+            shared = get_camera_tree(self.bl_idname, shared=True,)
+            ensure_camera_outputs(self.node_tree)
+            if (get_output_identifiers(self.node_tree)==get_output_identifiers(shared)):
+                self.swap_node_tree()
+
+        self.update()
+
+        return None
+
+    @classmethod
+    def get_outdated_instances(cls, from_depsgraph=False, updated_ids=None,):
+        """search for all nodes of this type needing a refresh.
+        if a set of updated IDs is given, only the nodes depending on them are returned"""
+
+        outdated, trees = [], set()
+        for n in get_all_instances(cls.bl_idname):
+            if (updated_ids is not None) and n.get_dependencies().isdisjoint(updated_ids):
+                continue
+            #only one node per shared tree need a refresh
+            if (n.node_tree is None) or (n.node_tree.session_uid in trees):
+                continue
+            trees.add(n.node_tree.session_uid)
+            outdated.append(n)
+            continue
+
+        return outdated
+
     @classmethod
-    def update_all_instances(cls, from_depsgraph=False,):
+    @profiled('nodeclass')
+    def update_all_instances(cls, from_depsgraph=False, updated_ids=None,):
         """search for all nodes of this type and update them"""
         
-        all_instances = [n for ng in bpy.data.node_groups for n in ng.nodes if (n.bl_idname==cls.bl_idname)]
-        for n in all_instances:
-            n.update()
+        open_camera_cache()
+        try:
+            for n in cls.get_outdated_instances(from_depsgraph=from_depsgraph, updated_ids=updated_ids,):
+                n.refresh()
+        finally:
+            close_camera_cache()
             
         return None 
@@ -6,13 +6,24 @@
 import bpy 
 
 from ..__init__ import get_addon_prefs
+from ..utils.profiler_utils import profiled
 from ..utils.str_utils import word_wrap
 from ..utils.node_utils import create_new_nodegroup, set_socket_defvalue
 
 
+#NOTE Walking all windows, areas & spaces on each signal is wasteful. We keep the rendered state of each 3d view space,
+#     rebuilt only when tagged dirty by our msgbus subscriptions (shading type, area type, window screen & workspace),
+#     or when the screens layout changed (areas split or closed don't notify the msgbus, we compare a cheap signature).
+#     In background mode there's no windows, there's no rendered view.
+
+RENDERED_VIEW = {'spaces':{}, 'signature':None, 'written':None,}   #spaces: {space pointer: is rendered}
+
+
 def all_3d_viewports():
     """return generator of all 3d view space"""
     for window in bpy.context.window_manager.windows:
+        if (window.screen is None):
+            continue
         for area in window.screen.areas:
             if (area.type == 'VIEW_3D'):
                 for space in area.spaces:
@@ -26,9 +37,35 @@ def all_3d_viewports_shading_type():
         yield space.shading.type
 
 
+def get_screens_signature():
+    """a cheap signature of the windows screens layout"""
+
+    return tuple((w.screen.as_pointer(), len(w.screen.areas))
+                 for w in bpy.context.window_manager.windows if (w.screen is not None))
+
+
+def tag_rendered_view_dirty(rewrite=False,):
+    """the rendered state of the 3d views will be gathered again on next access, optionally rewrite the output"""
+
+    RENDERED_VIEW['signature'] = None
+    if (rewrite):
+        RENDERED_VIEW['written'] = None
+
+    return None
+
+
 def is_rendered_view():
     """check if is rendered view in a 3d view somewhere"""
-    return 'RENDERED' in all_3d_viewports_shading_type()
+
+    if (bpy.app.background or bpy.context.window_manager is None):
+        return False
+
+    signature = get_screens_signature()
+    if (RENDERED_VIEW['signature']!=signature):
+        RENDERED_VIEW['spaces'] = {space.as_pointer(): (space.shading.type=='RENDERED') for space in all_3d_viewports()}
+        RENDERED_VIEW['signature'] = signature
+
+    return any(RENDERED_VIEW['spaces'].values())
 
 
 class NODEBOOSTER_NG_isrenderedview(bpy.types.GeometryNodeCustomGroup):
@@ -59,7 +96,8 @@ class NODEBOOSTER_NG_isrenderedview(bpy.types.GeometryNodeCustomGroup):
         self.node_tree = ng
         self.label = self.bl_label
 
-        set_socket_defvalue(ng, 0, value=is_rendered_view(),)
+        RENDERED_VIEW['written'] = is_rendered_view()
+        set_socket_defvalue(ng, 0, value=RENDERED_VIEW['written'],)
         return None 
 
     def update(self):
@@ -78,14 +116,21 @@ class NODEBOOSTER_NG_isrenderedview(bpy.types.GeometryNodeCustomGroup):
         return None 
     
     @classmethod
+    @profiled('nodeclass')
     def update_all_instances(cls, from_depsgraph=False,):
         """search for all nodes of this type and update them"""
         
+        #only write if the state flipped
+        value = is_rendered_view()
+        if (value==RENDERED_VIEW['written']):
+            return None
+
         #actually there's only one instance of this node nodetree
         name = f".{cls.bl_idname}"
         ng = bpy.data.node_groups.get(name)
         if (ng):
-            set_socket_defvalue(ng, 0, value=is_rendered_view(),)
+            set_socket_defvalue(ng, 0, value=value,)
+            RENDERED_VIEW['written'] = value
             
         return None
     
\ No newline at end of file
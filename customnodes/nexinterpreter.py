@@ -12,7 +12,9 @@ import re, traceback
 from ..__init__ import get_addon_prefs
 from ..resources import cust_icon
 from ..nex.nextypes import NexFactory, NexError
+from ..utils.profiler_utils import profiled, profiled_node
 from ..utils.str_utils import word_wrap
+from ..utils.registry_utils import register_instance, unregister_instance, get_all_instances, release_instance
 from ..utils.node_utils import (
     get_socket,
     create_socket,
@@ -83,7 +85,6 @@ class NODEBOOSTER_NG_nexinterpreter(bpy.types.GeometryNodeCustomGroup):
     • WIP text about synthax.
     • WIP text about how it works"""
 
-    #TODO Optimization: node_utils function should check if value or type isn't already set before setting it.
     #TODO maybe should add a nodebooster panel in text editor for quick execution?
 
     bl_idname = "GeometryNodeNodeBoosterNexInterpreter"
@@ -117,6 +118,7 @@ class NODEBOOSTER_NG_nexinterpreter(bpy.types.GeometryNodeCustomGroup):
         name="Automatically Refresh",
         description="Synchronize the interpreted python constants (if any) with the outputs values on each depsgraph frame and interaction. By toggling this option, your Nex script will be executed constantly on each interaction you have with blender (note that the internal nodetree will not be constantly rebuilt, press the Play button to do so.).",
         default=False,
+        update=lambda self, context: release_instance(self),
         )
 
     def init(self, context):
@@ -138,12 +140,15 @@ class NODEBOOSTER_NG_nexinterpreter(bpy.types.GeometryNodeCustomGroup):
         self.width = 185
         self.label = self.bl_label
 
+        register_instance(self)
+
         return None
 
     def copy(self,node,):
         """fct run when dupplicating the node"""
 
         self.node_tree = node.node_tree.copy()
+        register_instance(self)
 
         return None 
 
@@ -382,6 +387,7 @@ class NODEBOOSTER_NG_nexinterpreter(bpy.types.GeometryNodeCustomGroup):
         """when user delete the node we need to clean up"""
         
         self.user_textdata = None
+        unregister_instance(self)
 
         return None
 
@@ -425,19 +431,37 @@ class NODEBOOSTER_NG_nexinterpreter(bpy.types.GeometryNodeCustomGroup):
 
         return None
 
-    @classmethod
-    def update_all_instances(cls, from_depsgraph=False,):
-        """search for all nodes of this type and update them"""
+    @profiled_node
+    def refresh(self):
+        """re-evaluate the node outputs, called from our handlers"""
+
+        self.interpret_nex_script()
+
+        return None
 
+    @classmethod
+    def get_outdated_instances(cls, from_depsgraph=False, updated_ids=None,):
+        """search for all nodes of this type needing a refresh.
+        the dependencies of a Nex script are unknown, updated_ids are ignored"""
 
-        all_instances = [n for ng in bpy.data.node_groups for n in ng.nodes if (n.bl_idname==cls.bl_idname)]
-        for n in all_instances:
+        outdated = []
+        for n in get_all_instances(cls.bl_idname):
             if (from_depsgraph and not n.execute_at_depsgraph):
                 continue
             if (n.mute):
                 continue
-            n.interpret_nex_script()
+            outdated.append(n)
             continue
 
+        return outdated
+
+    @classmethod
+    @profiled('nodeclass')
+    def update_all_instances(cls, from_depsgraph=False, updated_ids=None,):
+        """search for all nodes of this type and update them"""
+
+        for n in cls.get_outdated_instances(from_depsgraph=from_depsgraph, updated_ids=updated_ids,):
+            n.refresh()
+
         return None
 
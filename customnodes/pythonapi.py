@@ -5,9 +5,17 @@
 
 import bpy 
 
+from types import MappingProxyType
+from collections import ChainMap
+from functools import lru_cache
+
 from ..__init__ import get_addon_prefs
 from ..resources import cust_icon
 from ..nex.pytonode import convert_pyvar_to_data
+from ..utils.profiler_utils import profiled, profiled_node
+from ..utils.users_utils import get_nodetree_users, get_users_index_version
+from ..utils.expression_utils import analyze_expression, evaluate_traced, is_animated, compile_fast_expression, UnsafeExpression
+from ..utils.registry_utils import register_instance, unregister_instance, get_all_instances, release_instance, get_instance_key
 from ..utils.node_utils import (
     create_new_nodegroup,
     set_socket_defvalue,
@@ -15,12 +23,57 @@ from ..utils.node_utils import (
     set_socket_label,
 )
 
+
+#NOTE The namespace of the expressions is made of a frozen base, built once, with the modules & constants,
+#     overlayed by the few volatile entries for each evaluation. Built on first use, 'bpy.data' is restricted at register time.
+
+BASE_NAMESPACE = {'namespace':None}
+
+
+#NOTE Dependencies recorded by the optional tracer on the last evaluation, for the expressions that can't be analyzed statically.
+TRACED_DEPENDENCIES = {}              #{(ng.session_uid, node.name): (expression, set of IDs)}
+TRACED_NAMES = {'C', 'context', 'scene', 'self', 'D',}
+
+#NOTE The static analysis costs about as much as an evaluation, its results are cached per node instance.
+#     Invalidated when the expression or the active scene changes, when the objects users index is rebuilt ('self' may
+#     now be another object, objects were added or removed), and after undo/load (all ID references are invalidated).
+DEPENDENCIES_CACHE = {}               #{(ng.session_uid, node.name): (signature, set of IDs or None, is frame dependent)}
+
+
+def clear_dependencies_cache():
+    """forget the dependencies of all expressions, they will be analyzed again on next access"""
+
+    DEPENDENCIES_CACHE.clear()
+    TRACED_DEPENDENCIES.clear()
+    return None
+
+
+def get_base_namespace():
+    """get the read-only namespace shared by all expressions"""
+
+    if (BASE_NAMESPACE['namespace'] is None):
+        namespace = {}
+        namespace["bpy"] = bpy
+        namespace["D"] = bpy.data
+        namespace.update(vars(__import__('random')))
+        namespace.update(vars(__import__('mathutils')))
+        namespace.update(vars(__import__('math')))
+        BASE_NAMESPACE['namespace'] = MappingProxyType(namespace)
+
+    return BASE_NAMESPACE['namespace']
+
+
+@lru_cache(maxsize=1024)
+def compile_expression(expression:str,):
+    """compile a python expression once, the code objects are cached by expression string"""
+
+    return compile(expression, '<string>', 'eval')
+
+
 class NODEBOOSTER_NG_pythonapi(bpy.types.GeometryNodeCustomGroup):
     """Custom Nodgroup: Evaluate a python expression as a single value output.
     • The evaluated values can be of type 'float', 'int', 'Vector', 'Color', 'Quaternion', 'Matrix', 'String', 'Object', 'Collection', 'Material' & 'list/tuple/set' up to len 16"""
 
-    #TODO Optimization: node_utils function should check if value or type isn't already set before setting it.
-    
     bl_idname = "GeometryNodeNodeBoosterPythonApi"
     bl_label = "Python Expression"
     # bl_icon = 'SCRIPT'
@@ -40,6 +93,7 @@ class NODEBOOSTER_NG_pythonapi(bpy.types.GeometryNodeCustomGroup):
         name="Automatically Refresh",
         description="Synchronize the python values with the outputs values on each depsgraph frame and interaction. By toggling this option, your script will be executed constantly.",
         default=True,
+        update=lambda self, context: release_instance(self),
         )
 
     @classmethod
@@ -67,12 +121,24 @@ class NODEBOOSTER_NG_pythonapi(bpy.types.GeometryNodeCustomGroup):
         self.width = 250
         self.label = self.bl_label
 
+        register_instance(self)
+
         return None 
 
     def copy(self,node,):
         """fct run when dupplicating the node"""
 
         self.node_tree = node.node_tree.copy()
+        register_instance(self)
+
+        return None
+
+    def free(self):
+        """when user delete the node we need to clean up"""
+
+        unregister_instance(self)
+        DEPENDENCIES_CACHE.pop(get_instance_key(self), None)
+        TRACED_DEPENDENCIES.pop(get_instance_key(self), None)
 
         return None 
 
@@ -81,8 +147,9 @@ class NODEBOOSTER_NG_pythonapi(bpy.types.GeometryNodeCustomGroup):
 
         return None
 
-    def evaluate_python_expression(self, assign_socketype=False,):
-        """evaluate the user string and assign value to output node"""
+    def evaluate_python_expression(self, assign_socketype=False, from_handlers=False,):
+        """evaluate the user string and assign value to output node.
+        if from_handlers, the evaluation runs without the user consent unless 'allow_auto_exec' is enabled"""
 
         ng = self.node_tree
         self.debug_evaluation_counter += 1 # potential issue with int limit here? idk how blender handle this
@@ -99,33 +166,56 @@ class NODEBOOSTER_NG_pythonapi(bpy.types.GeometryNodeCustomGroup):
             set_socket_defvalue(ng,1, value=True,)
             return None
 
-        to_evaluate = self.user_pyapiexp
-
-        #support for macros
-        if ('#frame' in to_evaluate):
-            to_evaluate = to_evaluate.replace('#frame','scene.frame_current')
+        to_evaluate = self.get_expression()
 
-        #define user namespace
-        namespace = {}
-        namespace["bpy"] = bpy
-        namespace["D"] = bpy.data
-        namespace["C"] = bpy.context
-        namespace["context"] = bpy.context
-        namespace["scene"] = bpy.context.scene
-        namespace.update(vars(__import__('random')))
-        namespace.update(vars(__import__('mathutils')))
-        namespace.update(vars(__import__('math')))
+        #define user namespace, the volatile entries overlay our base namespace
+        overlay = {
+            "C" : bpy.context,
+            "context" : bpy.context,
+            "scene" : bpy.context.scene,
+            }
 
         #'self' as object using this node? only if valid and not ambiguous
         node_obj_users = self.get_objects_from_node_instance()
         if (len(node_obj_users)==1):
-            namespace["self"] = list(node_obj_users)[0]
+            overlay["self"] = list(node_obj_users)[0]
+
+        namespace = ChainMap(overlay, get_base_namespace())
 
         #evaluated the user expression
         try:
             #NOTE, maybe the execution needs to check for some sort of blender checks before allowing execution?
             # a little like the driver python expression, there's a global setting for that. Unsure if it's needed.
-            evaluated_pyvalue = eval(to_evaluate, {}, namespace,)
+            #simple expressions are evaluated from precompiled closures, with their safety checks. never through eval()
+            #without the user consent, as they may run automatically
+            consent = (not from_handlers) or bpy.context.window_manager.nodebooster.allow_auto_exec
+            fast = compile_fast_expression(to_evaluate)
+            evaluated = False
+            if (fast is not None):
+                try:
+                    evaluated_pyvalue = fast(namespace)
+                    evaluated = True
+                except UnsafeExpression:
+                    #refused by our runtime guards, ex: '"Frame %d" % scene.frame_current'
+                    if (not consent):
+                        raise
+
+            if (not evaluated):
+                code = compile_expression(to_evaluate)
+
+                #record the touched IDs if the dependencies can't be found statically
+                traced = False
+                if (get_addon_prefs().use_expression_tracer) and (self.get_static_dependencies()[0] is None):
+                    try:
+                        evaluated_pyvalue, ids = evaluate_traced(code, namespace, TRACED_NAMES,)
+                        TRACED_DEPENDENCIES[get_instance_key(self)] = (to_evaluate, ids)
+                        traced = True
+                    except Exception:
+                        #perhaps our proxies are at fault, the regular evaluation will tell
+                        TRACED_DEPENDENCIES.pop(get_instance_key(self), None)
+
+                if (not traced):
+                    evaluated_pyvalue = eval(code, {}, namespace,)
 
         except Exception as e:
             print(f"{self.bl_idname} Evaluation Exception '{type(e).__name__}':\n{e}")
@@ -178,11 +268,13 @@ class NODEBOOSTER_NG_pythonapi(bpy.types.GeometryNodeCustomGroup):
         field.alert = is_error
         field.prop(self, "user_pyapiexp", placeholder="C.object.name", text="",)
 
+        is_safe = self.is_safe_expression()
+
         prop = row.row(align=True)
-        prop.enabled = sett_win.allow_auto_exec
+        prop.enabled = sett_win.allow_auto_exec or is_safe
         prop.prop(self, "execute_at_depsgraph", text="", icon_value=cust_icon(animated_icon),)
 
-        if (not sett_win.allow_auto_exec):
+        if (not sett_win.allow_auto_exec and not is_safe):
             col.separator(factor=0.75)
             col.prop(sett_win,"allow_auto_exec")
         
@@ -193,30 +285,120 @@ class NODEBOOSTER_NG_pythonapi(bpy.types.GeometryNodeCustomGroup):
 
         return None
 
+    def get_expression(self):
+        """get the expression to evaluate, with our macros substituted"""
+
+        expression = self.user_pyapiexp
+
+        #support for macros
+        if ('#frame' in expression):
+            expression = expression.replace('#frame','scene.frame_current')
+
+        return expression
+
+    def is_safe_expression(self):
+        """check if the expression only reads properties & uses pure functions, safe to run automatically"""
+
+        return compile_fast_expression(self.get_expression()) is not None
+
+    def get_static_dependencies(self):
+        """analyze the expression, get the IDs it depends on (None if unknown) and if it depends on the frame"""
+
+        expression = self.get_expression()
+        key = get_instance_key(self)
+        signature = (expression, bpy.context.scene.session_uid, get_users_index_version())
+
+        cached = DEPENDENCIES_CACHE.get(key)
+        if (cached is not None) and (cached[0]==signature):
+            return cached[1], cached[2]
+
+        users = self.get_objects_from_node_instance()
+        roots = {
+            "bpy" : bpy,
+            "D" : bpy.data,
+            "C" : bpy.context,
+            "context" : bpy.context,
+            "scene" : bpy.context.scene,
+            "self" : next(iter(users)) if (len(users)==1) else None,
+            }
+
+        dependencies, is_frame = analyze_expression(expression, roots,)
+        DEPENDENCIES_CACHE[key] = (signature, dependencies, is_frame)
+
+        return dependencies, is_frame
+
+    def get_dependencies(self):
+        """get the IDs this node expression depends on, None if unknown"""
+
+        dependencies, _ = self.get_static_dependencies()
+        if (dependencies is not None):
+            return dependencies
+
+        #perhaps our tracer recorded them on the last evaluation of this expression
+        expression, traced = TRACED_DEPENDENCIES.get(get_instance_key(self), (None, None))
+        if (traced is not None) and (expression==self.get_expression()):
+            return traced
+
+        return None
+
+    def is_frame_dependent(self):
+        """check if the expression needs to be evaluated on frame change"""
+
+        dependencies, is_frame = self.get_static_dependencies()
+        if (is_frame) or (dependencies is None):
+            return True
+
+        try:
+            return any(is_animated(id_data) for id_data in dependencies)
+        except ReferenceError:
+            #an ID has been removed meanwhile
+            return True
+
     def get_objects_from_node_instance(self,):
-        """Return a list of objects using the given GeometryNodeTree."""
+        """Return a set of objects using the nodetree of this node, directly or nested, through their geometry nodes modifiers"""
         
-        #NOTE could support recur nodegroups perhaps? altho it will cause ambiguity..
-        users = set()
-        for o in bpy.data.objects:
-            for m in o.modifiers:
-                if (m.type=='NODES' and m.node_group):
-                    for n in m.node_group.nodes:
-                        if (n==self):
-                            users.add(o)
-        return users
+        return get_nodetree_users(self.id_data)
 
-    @classmethod
-    def update_all_instances(cls, from_depsgraph=False,):
-        """search for all nodes of this type and update them"""
+    @profiled_node
+    def refresh(self):
+        """re-evaluate the node outputs, called from our handlers"""
+
+        self.evaluate_python_expression(assign_socketype=False, from_handlers=True,)
+
+        return None
 
-        all_instances = [n for ng in bpy.data.node_groups for n in ng.nodes if (n.bl_idname==cls.bl_idname)]
-        for n in all_instances:
+    @classmethod
+    def get_outdated_instances(cls, from_depsgraph=False, updated_ids=None, frame_change=False, safe_only=False,):
+        """search for all nodes of this type needing a refresh.
+        if a set of updated IDs is given, only the nodes depending on them are returned.
+        on frame change, only the frame dependent nodes are returned.
+        if safe_only, only the nodes with expressions safe to run automatically are returned"""
+
+        outdated = []
+        for n in get_all_instances(cls.bl_idname):
             if (from_depsgraph and not n.execute_at_depsgraph):
                 continue
             if (n.mute):
                 continue
-            n.evaluate_python_expression(assign_socketype=False)
+            if (safe_only and not n.is_safe_expression()):
+                continue
+            if (updated_ids is not None):
+                dependencies = n.get_dependencies()
+                if (dependencies is not None) and dependencies.isdisjoint(updated_ids):
+                    continue
+            if (frame_change and not n.is_frame_dependent()):
+                continue
+            outdated.append(n)
             continue
 
-        return None
\ No newline at end of file
+        return outdated
+
+    @classmethod
+    @profiled('nodeclass')
+    def update_all_instances(cls, from_depsgraph=False, updated_ids=None, frame_change=False, safe_only=False,):
+        """search for all nodes of this type and update them"""
+
+        for n in cls.get_outdated_instances(from_depsgraph=from_depsgraph, updated_ids=updated_ids, frame_change=frame_change, safe_only=safe_only,):
+            n.refresh()
+
+        return None
@@ -5,19 +5,170 @@
 
 import bpy 
 
+import numpy as np
+
+from math import floor
+
 from ..__init__ import get_addon_prefs
+from ..utils.profiler_utils import profiled, profiled_node
 from ..utils.str_utils import word_wrap
-from ..utils.node_utils import create_new_nodegroup, set_socket_defvalue
+from ..utils.registry_utils import register_instance, unregister_instance, get_all_instances
+from ..utils.node_utils import create_new_nodegroup, set_socket_defvalue, create_socket, remove_socket
+from ..utils.sequencer_utils import get_playing_strips, get_strips_in_range
+from ..utils.audio_utils import (
+    get_sound_envelope,
+    get_sound_spectrogram,
+    get_spectrogram_frequencies,
+    sample_envelope,
+    sample_envelope_range,
+    sample_envelope_window,
+    sample_sound_on_demand,
+    ENVELOPE_PEAK,
+    ENVELOPE_RMS,
+)
+
+
+def get_volume_fcurve(sequence):
+    """get the fcurve animating the volume of a sound strip, if any.
+    see https://github.com/snuq/VSEQF/blob/8487c256db536eb2e9288a16248fe394d06dfb74/fades.py#L57"""
+
+    scene = sequence.id_data
+    if (scene.animation_data is None) or (scene.animation_data.action is None):
+        return None
+
+    #the data path is 'sequence_editor.sequences_all["name"].volume', or 'strips_all' on newer versions
+    try:
+        return scene.animation_data.action.fcurves.find(sequence.path_from_id('volume'))
+    except Exception:
+        return None
+
+
+def evaluate_strip_volume(sequence, frames):
+    """evaluate the volume of a sound strip for an array of frames, the fcurve is sampled once per frame"""
+
+    fcurve = get_volume_fcurve(sequence)
+    if (fcurve is None):
+        return np.full(len(frames), sequence.volume, dtype=np.float32)
+
+    return np.fromiter((fcurve.evaluate(f) for f in frames), dtype=np.float32, count=len(frames),)
+
+
+def get_strip_window(sequence, idx, window):
+    """get the [lo, hi] envelope rows of a smoothing window ending at row idx, clamped to the played part of the strip.
+    idx may be an int or an array of ints"""
+
+    #the strip is played for frames in ]frame_final_start, frame_final_end[
+    first = floor(sequence.frame_final_start - sequence.frame_start)
+    last = floor(sequence.frame_final_end - 2 - sequence.frame_start)
+
+    lo = np.maximum(idx - window + 1, first)
+    hi = np.minimum(idx, last)
+
+    return lo, hi
+
+
+def get_band_bins(band_count, freq_min, freq_max,):
+    """split the [freq_min, freq_max] range in log-spaced bands, return the [a, b[ spectrogram bins range of each band"""
+
+    edges = get_spectrogram_frequencies()
+    centers = np.sqrt(edges[:-1] * edges[1:])
+    bands = np.geomspace(max(freq_min, 1.0), max(freq_max, freq_min+1.0), band_count+1)
+
+    ranges = []
+    for lo, hi in zip(bands[:-1], bands[1:]):
+        a, b = np.searchsorted(centers, (lo, hi))
+        #band narrower than our bins, we take the nearest one
+        if (a>=b):
+            a = min(int(np.abs(centers - np.sqrt(lo*hi)).argmin()), len(centers)-1)
+            b = a+1
+        ranges.append((int(a), int(b), float(lo), float(hi)))
+
+    return ranges
 
 
 class NODEBOOSTER_NG_sequencervolume(bpy.types.GeometryNodeCustomGroup):
     """Custom Nodgroup: Evaluate the active sound level of the VideoSequencer editor.
-    • Expect the value to be automatically updated on each on depsgraph post signals"""
+    • Expect the value to be automatically updated on each on depsgraph post signals
+    • Sounds are analyzed in the background the first time they are used"""
     
     bl_idname = "GeometryNodeNodeBoosterSequencerVolume"
     bl_label = "Sequencer Volume"
 
-    # frame_delay : bpy.props.IntProperty()
+    frame_delay : bpy.props.IntProperty(
+        name="Delay",
+        description="Sample the sound a given number of frames earlier. Use negative values to look ahead",
+        default=0,
+        update=lambda self, context: self.update(),
+        )
+    smoothing_window : bpy.props.IntProperty(
+        name="Smoothing",
+        description="Average the sound level over the given number of previous frames, creating a smooth falloff",
+        default=1,
+        min=1,
+        soft_max=100,
+        update=lambda self, context: self.update(),
+        )
+    envelope_type : bpy.props.EnumProperty(
+        name="Level",
+        description="How the sound level is measured on each frame",
+        items=(("PEAK", "Peak", "Maximal amplitude of the sound during the frame"),
+               ("RMS",  "RMS",  "Root mean square, the average loudness of the sound during the frame"),),
+        default="PEAK",
+        update=lambda self, context: self.update(),
+        )
+    filter_channels : bpy.props.StringProperty(
+        name="Channels",
+        description="Only evaluate the sound strips of these channels, ex: '1, 3-5'. Leave empty to evaluate all channels",
+        default="",
+        update=lambda self, context: self.update(),
+        )
+    filter_names : bpy.props.StringProperty(
+        name="Strips",
+        description="Only evaluate the sound strips matching these comma separated names, wildcards are supported, ex: 'Music*, Voice'. Leave empty to evaluate all strips",
+        default="",
+        update=lambda self, context: self.update(),
+        )
+    use_baked : bpy.props.BoolProperty(
+        name="Use Baked Values",
+        description="Read the values baked over the frame range instead of analyzing the sequencer sounds. Faster, and deterministic for renders",
+        default=False,
+        update=lambda self, context: self.update(),
+        )
+    baked_frame_start : bpy.props.IntProperty(
+        name="Baked Start",
+        description="First frame of the baked values",
+        default=0,
+        )
+    baked_stride : bpy.props.IntProperty(
+        name="Baked Outputs",
+        description="Number of baked values per frame, the volume and its frequency bands",
+        default=1,
+        min=1,
+        )
+    band_count : bpy.props.IntProperty(
+        name="Frequency Bands",
+        description="Output the sound level of a number of frequency bands, log-spaced between the minimum and maximum frequencies. Useful for bass/mid/treble drivers",
+        default=0,
+        min=0,
+        max=16,
+        update=lambda self, context: self.update_band_sockets(),
+        )
+    band_freq_min : bpy.props.FloatProperty(
+        name="Min Frequency",
+        description="Lowest frequency of the first band, in Hz",
+        default=20.0,
+        min=1.0,
+        max=20000.0,
+        update=lambda self, context: self.update_band_sockets(),
+        )
+    band_freq_max : bpy.props.FloatProperty(
+        name="Max Frequency",
+        description="Highest frequency of the last band, in Hz",
+        default=20000.0,
+        min=1.0,
+        max=20000.0,
+        update=lambda self, context: self.update_band_sockets(),
+        )
 
     @classmethod
     def poll(cls, context):
@@ -43,93 +194,269 @@ class NODEBOOSTER_NG_sequencervolume(bpy.types.GeometryNodeCustomGroup):
         self.width = 150
         self.label = self.bl_label
 
+        register_instance(self)
+
         return None 
 
     def copy(self,node,):
         """fct run when dupplicating the node"""
         
         self.node_tree = node.node_tree.copy()
+        register_instance(self)
         
+        return None
+
+    def free(self):
+        """when user delete the node we need to clean up"""
+
+        unregister_instance(self)
+
         return None 
     
     def update(self):
         """generic update function"""
         
         ng = self.node_tree
-        
-        # for later?
-        # frame = None 
-        # if (self.frame_delay):
-        #     frame = bpy.context.scene.frame_current + self.frame_delay
+
+        #baked values, we simply read them
+        if (self.use_baked and self.is_baked()):
+            self.write_values(self.sample_baked_values(bpy.context.scene.frame_current))
+            return None
+
+        frame = None 
+        if (self.frame_delay):
+            frame = bpy.context.scene.frame_current - self.frame_delay
 
         set_socket_defvalue(ng,0,
-            value=self.evaluate_sequencer_volume(),
+            value=self.evaluate_sequencer_volume(frame=frame),
             )
 
+        if (self.band_count):
+            for i,value in enumerate(self.evaluate_sequencer_bands(frame=frame)):
+                set_socket_defvalue(ng,i+1, value=float(value),)
+
         return None
 
-    def evaluate_sequencer_volume(self, frame=None,):
-        """evaluate the sequencer volume source
-        this node was possible thanks to tintwotin https://github.com/snuq/VSEQF/blob/3ac717e1fa8c7371ec40503428bc2d0d004f0b35/vseqf.py#L142"""
+    def write_values(self, values,):
+        """write the given outputs values, the volume followed by the frequency bands"""
+
+        ng = self.node_tree
+        count = 1+self.band_count
+
+        for i,value in enumerate(values[:count]):
+            set_socket_defvalue(ng,i, value=float(value),)
+
+        return None
+
+    def is_baked(self):
+        """check if this node has baked values"""
+
+        return ("baked_values" in self.keys())
+
+    def bake_values(self, frame_start, frame_end,):
+        """evaluate the outputs over the given frame range and store them as a packed float array in this node"""
+
+        values = self.evaluate_sequencer_volume_range(frame_start, frame_end, bands=True,)
+
+        self["baked_values"] = values.ravel().tolist()
+        self.baked_frame_start = frame_start
+        self.baked_stride = values.shape[1]
+        self.use_baked = True
+
+        return None
+
+    def clear_baked_values(self):
+        """remove the baked values"""
+
+        if self.is_baked():
+            del self["baked_values"]
+        self.use_baked = False
+
+        return None
+
+    def sample_baked_values(self, frame,):
+        """read the baked outputs at given frame, in O(1). Out of range frames are silent"""
+
+        #only the outputs existing on both sides
+        stride = self.baked_stride
+        count = min(stride, 1+self.band_count)
+
+        baked = self["baked_values"]
+        idx = (frame - self.baked_frame_start) * stride
+        if (idx<0 or idx+stride>len(baked)):
+            return [0.0]*count
+
+        return [float(baked[idx+i]) for i in range(count)]
+
+    def update_band_sockets(self):
+        """create one output socket per frequency band"""
+
+        ng = self.node_tree
+        names = [f"{lo:.0f}-{hi:.0f}Hz" for _,_,lo,hi in get_band_bins(self.band_count, self.band_freq_min, self.band_freq_max)]
+
+        #nothing changed?
+        current = [s.name for s in ng.nodes["Group Output"].inputs if (s.type!='CUSTOM')][1:]
+        if (current!=names):
+            for idx in reversed(range(1, len(current)+1)):
+                remove_socket(ng, idx, in_out='OUTPUT',)
+            for name in names:
+                create_socket(ng, in_out='OUTPUT', socket_type="NodeSocketFloat", socket_name=name,)
+
+        self.update()
 
-        #TODO ideally we need to also sample volume from few frame before or after, so user can create a smoothing falloff of some sort, 
-        #     that's what 'frame_delay' is for, but unfortunately this function is incomplete, frame can only be None in order to work
-        #     right now i do not have the strength to do it, you'll need to check for 'fades.get_fade_curve(bpy.context, sequence, create=False)' from the github link above
+        return None
+
+    def iter_playing_strips(self, frame=None,):
+        """iterate the sound strips playing at given frame (or still within their smoothing falloff).
+        yield the strip, its envelope row index & its volume"""
 
         scene = bpy.context.scene
-        if (scene.sequence_editor is None):
-            return 0
-        
-        totvolume = 0
-        sequences = scene.sequence_editor.sequences_all
-        depsgraph = bpy.context.evaluated_depsgraph_get()
-        
+
+        #if frame is given, we can't rely on the animated volume values of the current frame
         if (frame is None):
               frame = scene.frame_current
               evaluate_volume = False
         else: evaluate_volume = True
 
+        #with smoothing, a strip keeps contributing for a few frames after it ended
+        strips = get_playing_strips(scene, frame, tail=self.smoothing_window-1,
+            channels=self.filter_channels, names=self.filter_names,)
+
+        for sequence in strips:
+
+            if evaluate_volume:
+                  volume = evaluate_strip_volume(sequence, (frame,))[0]
+            else: volume = sequence.volume
+
+            yield sequence, floor(frame - 1 - sequence.frame_start), volume
+            continue
+
+        return None
+
+    def evaluate_sequencer_volume(self, frame=None,):
+        """evaluate the sequencer volume source
+        this node was possible thanks to tintwotin https://github.com/snuq/VSEQF/blob/3ac717e1fa8c7371ec40503428bc2d0d004f0b35/vseqf.py#L142"""
+
+        scene = bpy.context.scene
+        totvolume = 0
+        depsgraph = bpy.context.evaluated_depsgraph_get()
         fps = scene.render.fps / scene.render.fps_base
+        column = ENVELOPE_RMS if (self.envelope_type=='RMS') else ENVELOPE_PEAK
+        window = self.smoothing_window
 
-        for sequence in sequences:
-
-            if ((sequence.type=='SOUND') and (sequence.frame_final_start<frame) 
-                and (sequence.frame_final_end>frame) and (not sequence.mute)):
-               
-                time_from = (frame - 1 - sequence.frame_start) / fps
-                time_to = (frame - sequence.frame_start) / fps
-
-                audio = sequence.sound.evaluated_get(depsgraph).factory
-                chunk = audio.limit(time_from, time_to).data()
-                
-                #sometimes the chunks cannot be read properly, try to read 2 frames instead
-                if (len(chunk)==0):
-                    time_from_temp = (frame - 2 - sequence.frame_start) / fps
-                    chunk = audio.limit(time_from_temp, time_to).data()
-                    
-                #chunk still couldnt be read...
-                if (len(chunk)==0):
-                    average = 0
+        for sequence, idx, volume in self.iter_playing_strips(frame=frame):
 
-                else:
-                    cmax, cmin = abs(chunk.max()), abs(chunk.min())
-                    average = cmax if (cmax > cmin) else cmin
-
-                if evaluate_volume:
-                    # TODO: for later? get fade curve https://github.com/snuq/VSEQF/blob/8487c256db536eb2e9288a16248fe394d06dfb74/fades.py#L57
-                    # fcurve = get_fade_curve(bpy.context, sequence, create=False)
-                    # if (fcurve):
-                    #       volume = fcurve.evaluate(frame)
-                    # else: volume = sequence.volume
-                    volume = 0
-                else:
-                    volume = sequence.volume
+            #the sound is decoded only once, we simply sample its cached envelope.
+            #the envelope is computed in the background, meanwhile we sample the sound on demand
+            envelope = get_sound_envelope(sequence.sound, fps, depsgraph=depsgraph,
+                asynchronous=True, on_ready=self.__class__.update_all_instances,)
 
-                totvolume += (average * volume)
-            
+            if (envelope is None):
+                if (idx>=floor(sequence.frame_final_end - 1 - sequence.frame_start)):
+                    continue
+                average = sample_sound_on_demand(sequence.sound, fps, idx, column=column, depsgraph=depsgraph,)
+
+            elif (window>1):
+                lo, hi = get_strip_window(sequence, idx, window)
+                average = sample_envelope_window(envelope, lo, hi, window, column=column,)
+
+            else:
+                average = sample_envelope(envelope, idx, column=column,)
+
+            totvolume += (average * volume)
             continue 
 
         return float(totvolume)
+
+    def evaluate_sequencer_bands(self, frame=None,):
+        """evaluate the level of each frequency band of the sequencer, from the cached spectrograms.
+        return a float32 array of len band_count. Bands are silent until the spectrograms are analyzed"""
+
+        scene = bpy.context.scene
+        depsgraph = bpy.context.evaluated_depsgraph_get()
+        fps = scene.render.fps / scene.render.fps_base
+        window = self.smoothing_window
+        ranges = get_band_bins(self.band_count, self.band_freq_min, self.band_freq_max)
+        totbands = np.zeros(len(ranges), dtype=np.float32)
+
+        for sequence, idx, volume in self.iter_playing_strips(frame=frame):
+
+            spectrogram = get_sound_spectrogram(sequence.sound, fps, depsgraph=depsgraph,
+                asynchronous=True, on_ready=self.__class__.update_all_instances,)
+            if (spectrogram is None):
+                continue
+
+            #the whole spectrogram row, or its windowed average
+            if (window>1):
+                  lo, hi = get_strip_window(sequence, idx, window)
+                  row = sample_envelope_window(spectrogram, lo, hi, window, column=slice(None),)
+            elif (0 <= idx < len(spectrogram)):
+                  row = spectrogram[idx]
+            else: continue
+
+            totbands += np.array([row[a:b].max() for a,b,_,_ in ranges], dtype=np.float32) * volume
+            continue
+
+        return totbands
+
+    def evaluate_sequencer_volume_range(self, frame_start, frame_end, bands=False,):
+        """evaluate the sequencer volume for a whole range of frames [frame_start, frame_end], in one numpy pass.
+        return a float32 array of len (frame_end-frame_start+1), or of shape (frames, 1+band_count) with the frequency bands.
+        The sounds are analyzed synchronously.
+        unlike evaluate_sequencer_volume() which expects an already delayed frame, the delay option is applied here"""
+
+        frames = np.arange(frame_start, frame_end+1, dtype=np.float64)
+        ranges = get_band_bins(self.band_count, self.band_freq_min, self.band_freq_max) if bands else []
+        totvolume = np.zeros((len(frames), 1+len(ranges)), dtype=np.float32)
+
+        scene = bpy.context.scene
+        if (scene.sequence_editor is None) or (len(frames)==0):
+            return totvolume if bands else totvolume[:,0]
+
+        depsgraph = bpy.context.evaluated_depsgraph_get()
+        fps = scene.render.fps / scene.render.fps_base
+        column = ENVELOPE_RMS if (self.envelope_type=='RMS') else ENVELOPE_PEAK
+        window = self.smoothing_window
+        sampled = frames - self.frame_delay
+
+        strips = get_strips_in_range(scene, sampled[0], sampled[-1], tail=window-1,
+            channels=self.filter_channels, names=self.filter_names,)
+
+        for sequence in strips:
+
+            #only the frames where this strip is playing (or smoothed)
+            mask = (sampled>sequence.frame_final_start) & (sampled<sequence.frame_final_end+window-1)
+            if (not mask.any()):
+                continue
+
+            active_frames = sampled[mask]
+            volumes = evaluate_strip_volume(sequence, active_frames)
+            envelope = get_sound_envelope(sequence.sound, fps, depsgraph=depsgraph,)
+            indices = np.floor(active_frames - 1 - sequence.frame_start).astype(np.int64)
+
+            if (window>1):
+                  lo, hi = get_strip_window(sequence, indices, window)
+                  levels = sample_envelope_window(envelope, lo, hi, window, column=column,)
+            else: levels = sample_envelope_range(envelope, indices, column=column,)
+
+            totvolume[mask,0] += levels * volumes
+
+            if (ranges):
+                spectrogram = get_sound_spectrogram(sequence.sound, fps, depsgraph=depsgraph,)
+
+                if (window>1):
+                    rows = sample_envelope_window(spectrogram, lo, hi, window, column=slice(None),)
+                else:
+                    valid = (indices>=0) & (indices<len(spectrogram))
+                    rows = np.zeros((len(indices), spectrogram.shape[1]), dtype=np.float32)
+                    rows[valid] = spectrogram[indices[valid]]
+
+                for i,(a,b,_,_) in enumerate(ranges):
+                    totvolume[mask,i+1] += rows[:,a:b].max(axis=1) * volumes
+
+            continue
+
+        return totvolume if bands else totvolume[:,0]
     
     def draw_label(self,):
         """node label"""
@@ -139,17 +466,30 @@ class NODEBOOSTER_NG_sequencervolume(bpy.types.GeometryNodeCustomGroup):
     def draw_buttons(self,context,layout,):
         """node interface drawing"""
         
-        #for later?
-        #layout.prop(self,"frame_delay",text="Frame Delay")
+        col = layout.column(align=True)
+        col.prop(self, "envelope_type", text="",)
+        col.prop(self, "frame_delay",)
+        col.prop(self, "smoothing_window",)
+        col.prop(self, "band_count",)
+        col.prop(self, "filter_channels", text="", icon="SEQ_STRIP_DUPLICATE", placeholder="All Channels",)
 
         return None 
     
+    @profiled_node
+    def refresh(self):
+        """re-evaluate the node outputs, called from our handlers"""
+
+        self.update()
+
+        return None
+
     @classmethod
+    @profiled('nodeclass')
     def update_all_instances(cls, from_depsgraph=False,):
         """search for all nodes of this type and update them"""
 
-        all_instances = [n for ng in bpy.data.node_groups for n in ng.nodes if (n.bl_idname==cls.bl_idname)]
+        all_instances = get_all_instances(cls.bl_idname)
         for n in all_instances:
-            n.update()
+            n.refresh()
 
         return None
\ No newline at end of file
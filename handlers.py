@@ -5,10 +5,22 @@
 
 import bpy 
 
+import time
+
+from itertools import groupby
 from collections.abc import Iterable
 
 from .__init__ import get_addon_prefs
 from .operators.palette import msgbus_palette_callback
+from .utils.node_utils import WRITE_STATS
+from .utils.profiler_utils import profiled, profile_scope, set_profiling
+from .utils.registry_utils import tag_registry_dirty, get_instance_key, is_suppressed, suppress_instance, get_all_instances, get_registry_version
+from .utils.sequencer_utils import tag_sequencer_index_dirty
+from .utils.audio_utils import ensure_envelope_timer
+from .utils.users_utils import tag_users_index_dirty, update_users_index
+from .customnodes.isrenderedview import tag_rendered_view_dirty
+from .customnodes.camerainfo import clear_camera_snapshots, open_camera_cache, close_camera_cache
+from .customnodes.pythonapi import clear_dependencies_cache
 from .customnodes import (
     NODEBOOSTER_NG_camerainfo,
     NODEBOOSTER_NG_pythonapi,
@@ -25,6 +37,7 @@ MSGBUSOWNER_VIEWPORT_SHADING = object()
 MSGBUSOWNER_PALETTE =  object()
 
 
+@profiled('handler')
 def msgbus_viewportshading_callback(*args):
     
     sett_plugin = get_addon_prefs()
@@ -32,6 +45,7 @@ def msgbus_viewportshading_callback(*args):
     if (sett_plugin.debug_depsgraph):
         print("msgbus_viewportshading_callback(): msgbus signal")
 
+    tag_rendered_view_dirty()
     NODEBOOSTER_NG_isrenderedview.update_all_instances(from_depsgraph=True)
 
     return None 
@@ -39,13 +53,15 @@ def msgbus_viewportshading_callback(*args):
 
 def register_msgbusses():
     
-    bpy.msgbus.subscribe_rna(
-        key=(bpy.types.View3DShading, "type"),
-        owner=MSGBUSOWNER_VIEWPORT_SHADING,
-        notify=msgbus_viewportshading_callback,
-        args=(None,),
-        options={"PERSISTENT"},
-        )
+    #the rendered view state changes with the shading type, or with the areas & screens displayed
+    for key in ((bpy.types.View3DShading, "type"), (bpy.types.Area, "type"), (bpy.types.Window, "screen"), (bpy.types.Window, "workspace")):
+        bpy.msgbus.subscribe_rna(
+            key=key,
+            owner=MSGBUSOWNER_VIEWPORT_SHADING,
+            notify=msgbus_viewportshading_callback,
+            args=(None,),
+            options={"PERSISTENT"},
+            )
     bpy.msgbus.subscribe_rna(
         key=bpy.types.PaletteColor,
         owner=MSGBUSOWNER_PALETTE,
@@ -68,29 +84,249 @@ def unregister_msgbusses():
 # Then we register the handlers
 
 
+def get_updated_ids(depsgraph):
+    """gather the original IDs reported as updated by the depsgraph"""
+
+    return {update.id.original for update in depsgraph.updates}
+
+
 @bpy.app.handlers.persistent
+@profiled('handler')
 def nodebooster_handler_depspost(scene,desp):
     """update on depsgraph change"""
 
     sett_plugin = get_addon_prefs()
-    sett_win = bpy.context.window_manager.nodebooster
 
     if (sett_plugin.debug_depsgraph):
         print("nodebooster_handler_depspost(): depsgraph signal")
 
+    #re-entrancy guard, our own refreshes may trigger depsgraph signals
+    if (HANDLER_STATE['running']):
+        return None
+
+    #during a render job, our nodes are refreshed on frame change only
+    if (RENDER_STATE['active']):
+        return None
+
+    #did our last refresh write values? then this signal is likely caused by ourselves
+    feedback = HANDLER_STATE['wrote']
+    HANDLER_STATE['wrote'] = False
+
+    #we only dispatch the updates to the nodes depending on the updated IDs
+    updated_ids = get_updated_ids(desp)
+
+    #the modifiers or nested groups might have changed, our objects users index need a rebuild
+    update_users_index(updated_ids)
+
+    #too many signals in a single event loop tick? something is ping-ponging, or a script is doing many updates.
+    #we postpone the work to a deferred refresh rather than discarding it
+    within_limit = count_tick_call()
+
+    #bursts of signals are coalesced into a deferred refresh, no timers in background mode
+    if (not within_limit) or ((sett_plugin.handlers_min_interval>0) and (not bpy.app.background)):
+        DEFERRED_REFRESH['ids'].update(updated_ids)
+        DEFERRED_REFRESH['feedback'] &= feedback
+        if (not bpy.app.timers.is_registered(nodebooster_deferred_refresh)):
+            bpy.app.timers.register(nodebooster_deferred_refresh, first_interval=sett_plugin.handlers_min_interval,)
+        return None
+
+    #the camera nodes share their camera evaluations
+    open_camera_cache()
+    try:
+        refreshed = set()
+        for cls, nodes in groupby(get_outdated_nodes(updated_ids), key=type):
+            with profile_scope('nodeclass', get_class_profile_name(cls)):
+                for n in nodes:
+                    refresh_node(n, feedback, refreshed,)
+        end_storm_detection(feedback, refreshed,)
+    finally:
+        close_camera_cache()
+
+    return None
+
+
+# Re-entrancy guard & update storm detection
+
+
+#NOTE A node writing its outputs will tag its nodetree dirty and trigger another depsgraph signal, calling our handler again.
+#     It's fine as long as the written values are stable (values are only written if changed, see node_utils).
+#     But a node writing different values on each refresh (ex: a Nex script using random values) will ping-pong forever.
+#     We consider a signal as a feedback if our previous refresh wrote values, and we count how many consecutive feedback
+#     refreshes each node wrote values in. Past a threshold, the node is suspended from the handlers refresh,
+#     until the user toggles its automatic refresh option. The Camera Info nodes have no such option, and their writes
+#     are already gated by their camera snapshots (they only write when the camera moves, ex: a continuous camera drag),
+#     they are excluded from the storm detection.
+
+STORM_THRESHOLD = 64                  #consecutive feedback refreshes writing values before suspending a node
+TICK_CALLS_MAX = 32                   #max depsgraph signals handled within a single event loop tick
+
+HANDLER_STATE = {'running':False, 'wrote':False, 'tick_calls':0, 'storms':{},}
+STORM_EXEMPT = {NODEBOOSTER_NG_camerainfo.bl_idname,}
+
+
+def nodebooster_tick_reset():
+    """bpy.app.timers callback, run once on the next event loop tick"""
+
+    HANDLER_STATE['tick_calls'] = 0
+    return None
+
+
+def count_tick_call():
+    """count the depsgraph signals of this event loop tick, return False if over the limit"""
+
+    if (bpy.app.background):
+        return True
+
+    if (HANDLER_STATE['tick_calls']==0):
+        bpy.app.timers.register(nodebooster_tick_reset, first_interval=0.0,)
+
+    HANDLER_STATE['tick_calls'] += 1
+    if (HANDLER_STATE['tick_calls']==TICK_CALLS_MAX+1):
+        print(f"WARNING: nodebooster_handler_depspost(): more than {TICK_CALLS_MAX} depsgraph signals in a single event loop tick, deferring the next ones.")
+
+    return HANDLER_STATE['tick_calls']<=TICK_CALLS_MAX
+
+
+def get_class_profile_name(cls):
+    """our handlers refresh the nodes directly, we record their cost under their class 'update_all_instances' entry"""
+
+    return f"{cls.__qualname__}.update_all_instances"
+
+
+def refresh_node(n, feedback, refreshed,):
+    """refresh a node within our re-entrancy guard, keep track of the nodes writing values on each feedback signal"""
+
+    if is_suppressed(n):
+        return None
+
+    applied = WRITE_STATS['applied']
+
+    HANDLER_STATE['running'] = True
+    try:
+        n.refresh()
+    finally:
+        HANDLER_STATE['running'] = False
+
+    wrote = (WRITE_STATS['applied']!=applied)
+    HANDLER_STATE['wrote'] |= wrote
+
+    if (n.bl_idname in STORM_EXEMPT):
+        return None
+
+    key = get_instance_key(n)
+    refreshed.add(key)
+    storms = HANDLER_STATE['storms']
+
+    if (feedback and wrote):
+        storms[key] = storms.get(key, 0) + 1
+        if (storms[key]>=STORM_THRESHOLD):
+            del storms[key]
+            suppress_instance(n, message="Toggle its automatic refresh option to resume.",)
+    else:
+        storms.pop(key, None)
+
+    return None
+
+
+def end_storm_detection(feedback, refreshed,):
+    """nodes not refreshed by a feedback signal, or any node after a regular signal, are not storming"""
+
+    storms = HANDLER_STATE['storms']
+    if (not feedback):
+        storms.clear()
+        return None
+
+    for key in [k for k in storms if (k not in refreshed)]:
+        del storms[key]
+
+    return None
+
+
+# Deferred refresh of the depsgraph updates
+
+
+DEFERRED_REFRESH = {'ids':set(), 'queue':[], 'feedback':True, 'batch_feedback':True, 'refreshed':set(),}
+
+
+def get_outdated_nodes(updated_ids):
+    """get all the nodes that need a refresh after the given IDs were updated"""
+
+    sett_win = bpy.context.window_manager.nodebooster
+
     #need to update camera nodes outputs
-    NODEBOOSTER_NG_camerainfo.update_all_instances(from_depsgraph=True)
+    nodes = NODEBOOSTER_NG_camerainfo.get_outdated_instances(from_depsgraph=True, updated_ids=updated_ids,)
 
     #automatic re-evaluation of the Python Expression and Python Nex Nodes.
     #for security reasons, only if the user allows it expressively on each program session.
     if (sett_win.allow_auto_exec):
-        NODEBOOSTER_NG_pythonapi.update_all_instances(from_depsgraph=True)
-        NODEBOOSTER_NG_nexinterpreter.update_all_instances(from_depsgraph=True)
+        nodes += NODEBOOSTER_NG_pythonapi.get_outdated_instances(from_depsgraph=True, updated_ids=updated_ids,)
+        nodes += NODEBOOSTER_NG_nexinterpreter.get_outdated_instances(from_depsgraph=True, updated_ids=updated_ids,)
+    else:
+        #the simple expressions only reading properties are safe to run anyway
+        nodes += NODEBOOSTER_NG_pythonapi.get_outdated_instances(from_depsgraph=True, updated_ids=updated_ids, safe_only=True,)
+
+    return nodes
+
+
+@profiled('handler')
+def nodebooster_deferred_refresh():
+    """bpy.app.timers callback, refresh the nodes outdated by the coalesced depsgraph signals,
+    within a time budget per tick. The work left will roll over to the next tick"""
+
+    sett_plugin = get_addon_prefs()
+    queue = DEFERRED_REFRESH['queue']
+
+    #start a new batch with the coalesced signals. we store node names, references to nodes may dangle between ticks
+    if (not queue):
+        updated_ids = DEFERRED_REFRESH['ids'].copy()
+        DEFERRED_REFRESH['ids'].clear()
+        DEFERRED_REFRESH['batch_feedback'] = DEFERRED_REFRESH['feedback']
+        DEFERRED_REFRESH['feedback'] = True
+        DEFERRED_REFRESH['refreshed'].clear()
+        queue.extend((n.id_data, n.name) for n in get_outdated_nodes(updated_ids))
+
+    if (sett_plugin.debug_depsgraph):
+        print(f"nodebooster_deferred_refresh(): {len(queue)} nodes to refresh")
 
+    budget = sett_plugin.handlers_time_budget / 1000
+    t0 = time.perf_counter()
+
+    #the camera nodes share their camera evaluations within this tick
+    open_camera_cache()
+    try:
+        while (queue):
+
+            ng, name = queue.pop(0)
+
+            try:
+                n = ng.nodes.get(name)
+            except ReferenceError:
+                #the nodetree has been removed meanwhile
+                continue
+            if (n is not None):
+                with profile_scope('nodeclass', get_class_profile_name(type(n))):
+                    refresh_node(n, DEFERRED_REFRESH['batch_feedback'], DEFERRED_REFRESH['refreshed'],)
+
+            if (time.perf_counter()-t0 > budget):
+                break
+
+            continue
+    finally:
+        close_camera_cache()
+
+    #roll over to the next tick
+    if (queue):
+        return 0.0
+
+    end_storm_detection(DEFERRED_REFRESH['batch_feedback'], DEFERRED_REFRESH['refreshed'],)
+
+    if (DEFERRED_REFRESH['ids']):
+        return sett_plugin.handlers_min_interval
     return None
 
 
 @bpy.app.handlers.persistent
+@profiled('handler')
 def nodebooster_handler_framepre(scene,desp):
     """update on frame change"""
 
@@ -100,6 +336,11 @@ def nodebooster_handler_framepre(scene,desp):
     if (sett_plugin.debug_depsgraph):
         print("nodebooster_handler_framepre(): frame_pre signal")
 
+    #render jobs & background mode take a fast path
+    if (RENDER_STATE['active'] or bpy.app.background):
+        render_frame_refresh(scene)
+        return None
+
     #need to update camera nodes outputs
     NODEBOOSTER_NG_camerainfo.update_all_instances(from_depsgraph=True)
 
@@ -109,8 +350,105 @@ def nodebooster_handler_framepre(scene,desp):
     #automatic re-evaluation of the Python Expression and Python Nex Nodes.
     #for security reasons, only if the user allows it expressively on each program session.
     if (sett_win.allow_auto_exec):
-        NODEBOOSTER_NG_pythonapi.update_all_instances(from_depsgraph=True)
+        NODEBOOSTER_NG_pythonapi.update_all_instances(from_depsgraph=True, frame_change=True,)
         NODEBOOSTER_NG_nexinterpreter.update_all_instances(from_depsgraph=True)
+    else:
+        #the simple expressions only reading properties are safe to run anyway
+        NODEBOOSTER_NG_pythonapi.update_all_instances(from_depsgraph=True, frame_change=True, safe_only=True,)
+
+    return None
+
+
+# Render jobs & background mode fast path
+
+
+#NOTE During a render job, or in background mode on a render farm, there's no user interaction.
+#     The node set is resolved once per job instead of on each frame, UI only nodes are skipped,
+#     and the frame dependent nodes that can be evaluated over a range are pre-evaluated for the whole frame range up front.
+
+RENDER_STATE = {'active':False, 'nodes':None, 'version':-1,}      #nodes: [(node, frame_start, values or None)]
+
+
+def get_render_nodes(scene, prefetch=False,):
+    """resolve the nodes to refresh on each frame of a render job, optionally pre-evaluate the frame range"""
+
+    sett_win = bpy.context.window_manager.nodebooster
+
+    nodes = NODEBOOSTER_NG_camerainfo.get_outdated_instances(from_depsgraph=True,)
+    if (sett_win.allow_auto_exec):
+        nodes += NODEBOOSTER_NG_pythonapi.get_outdated_instances(from_depsgraph=True, frame_change=True,)
+        nodes += NODEBOOSTER_NG_nexinterpreter.get_outdated_instances(from_depsgraph=True,)
+    else:
+        nodes += NODEBOOSTER_NG_pythonapi.get_outdated_instances(from_depsgraph=True, frame_change=True, safe_only=True,)
+
+    render_nodes = [(n, 0, None) for n in nodes if not is_suppressed(n)]
+
+    for n in get_all_instances(NODEBOOSTER_NG_sequencervolume.bl_idname):
+        if (prefetch and not (n.use_baked and n.is_baked())):
+              values = n.evaluate_sequencer_volume_range(scene.frame_start, scene.frame_end, bands=True,)
+              render_nodes.append((n, scene.frame_start, values))
+        else: render_nodes.append((n, 0, None))
+        continue
+
+    return render_nodes
+
+
+def render_frame_refresh(scene):
+    """refresh the nodes of the current render job, or of the background session"""
+
+    #nodes added or removed by a script meanwhile?
+    if (RENDER_STATE['nodes'] is None) or (RENDER_STATE['version']!=get_registry_version()):
+        RENDER_STATE['nodes'] = get_render_nodes(scene, prefetch=RENDER_STATE['active'],)
+        RENDER_STATE['version'] = get_registry_version()
+
+    frame = scene.frame_current
+
+    open_camera_cache()
+    try:
+        for n, frame_start, values in RENDER_STATE['nodes']:
+            try:
+                idx = frame - frame_start
+                if (values is not None) and (0<=idx<len(values)):
+                      n.write_values(values[idx])
+                else: n.refresh()
+            except ReferenceError:
+                #the node has been removed meanwhile, by a script perhaps
+                RENDER_STATE['nodes'] = None
+            continue
+    finally:
+        close_camera_cache()
+
+    return None
+
+
+@bpy.app.handlers.persistent
+@profiled('handler')
+def nodebooster_handler_renderinit(scene,desp):
+    """Handler function when a render job starts"""
+
+    sett_plugin = get_addon_prefs()
+
+    if (sett_plugin.debug_depsgraph):
+        print("nodebooster_handler_renderinit(): render_init signal")
+
+    RENDER_STATE['active'] = True
+    RENDER_STATE['nodes'] = get_render_nodes(scene, prefetch=True,)
+    RENDER_STATE['version'] = get_registry_version()
+
+    return None
+
+
+@bpy.app.handlers.persistent
+def nodebooster_handler_rendercomplete(scene,desp):
+    """Handler function when a render job is completed or cancelled"""
+
+    sett_plugin = get_addon_prefs()
+
+    if (sett_plugin.debug_depsgraph):
+        print("nodebooster_handler_rendercomplete(): render_complete/render_cancel signal")
+
+    RENDER_STATE['active'] = False
+    RENDER_STATE['nodes'] = None
 
     return None
 
@@ -127,6 +465,43 @@ def nodebooster_handler_loadpost(scene,desp):
     #need to add message bus on each blender load
     register_msgbusses()
 
+    #the sounds analysis still running are handed back by our timer
+    ensure_envelope_timer()
+
+    #all our nodes references are now invalid
+    tag_registry_dirty()
+    tag_users_index_dirty()
+    tag_rendered_view_dirty(rewrite=True)
+    NODEBOOSTER_NG_isrenderedview.update_all_instances(from_depsgraph=True)
+    clear_dependencies_cache()
+    clear_camera_snapshots()
+    tag_sequencer_index_dirty()
+    DEFERRED_REFRESH['ids'].clear()
+    RENDER_STATE['nodes'] = None
+
+    return None
+
+
+@bpy.app.handlers.persistent
+def nodebooster_handler_undopost(scene,desp):
+    """Handler function when user is undoing/redoing an action"""
+
+    sett_plugin = get_addon_prefs()
+
+    if (sett_plugin.debug_depsgraph):
+        print("nodebooster_handler_undopost(): undo_post/redo_post signal")
+
+    #undo steps reload the IDs, our nodes references are now invalid
+    tag_registry_dirty()
+    tag_users_index_dirty()
+    tag_rendered_view_dirty(rewrite=True)
+    NODEBOOSTER_NG_isrenderedview.update_all_instances(from_depsgraph=True)
+    clear_dependencies_cache()
+    clear_camera_snapshots()
+    tag_sequencer_index_dirty()
+    DEFERRED_REFRESH['ids'].clear()
+    RENDER_STATE['nodes'] = None
+
     return None
 
 
@@ -143,6 +518,8 @@ def all_handlers(name=False):
 
 
 def load_handlers():
+
+    set_profiling(get_addon_prefs().debug_profiling)
     
     handler_names = [h.__name__ for h in all_handlers()]
 
@@ -154,13 +531,37 @@ def load_handlers():
 
     if ('nodebooster_handler_loadpost' not in handler_names):
         bpy.app.handlers.load_post.append(nodebooster_handler_loadpost)
+
+    if ('nodebooster_handler_undopost' not in handler_names):
+        bpy.app.handlers.undo_post.append(nodebooster_handler_undopost)
+        bpy.app.handlers.redo_post.append(nodebooster_handler_undopost)
+
+    if ('nodebooster_handler_renderinit' not in handler_names):
+        bpy.app.handlers.render_init.append(nodebooster_handler_renderinit)
+
+    if ('nodebooster_handler_rendercomplete' not in handler_names):
+        bpy.app.handlers.render_complete.append(nodebooster_handler_rendercomplete)
+        bpy.app.handlers.render_cancel.append(nodebooster_handler_rendercomplete)
         
     return None 
 
 
 def unload_handlers():
 
-    for h in all_handlers():
+    if (bpy.app.timers.is_registered(nodebooster_deferred_refresh)):
+        bpy.app.timers.unregister(nodebooster_deferred_refresh)
+    DEFERRED_REFRESH['ids'].clear()
+    DEFERRED_REFRESH['queue'].clear()
+
+    if (bpy.app.timers.is_registered(nodebooster_tick_reset)):
+        bpy.app.timers.unregister(nodebooster_tick_reset)
+    HANDLER_STATE['tick_calls'] = 0
+    HANDLER_STATE['storms'].clear()
+
+    RENDER_STATE['active'] = False
+    RENDER_STATE['nodes'] = None
+
+    for h in list(all_handlers()):
 
         if(h.__name__=='nodebooster_handler_depspost'):
             bpy.app.handlers.depsgraph_update_post.remove(h)
@@ -171,4 +572,19 @@ def unload_handlers():
         if(h.__name__=='nodebooster_handler_loadpost'):
             bpy.app.handlers.load_post.remove(h)
 
+        if(h.__name__=='nodebooster_handler_undopost'):
+            if (h in bpy.app.handlers.undo_post):
+                bpy.app.handlers.undo_post.remove(h)
+            if (h in bpy.app.handlers.redo_post):
+                bpy.app.handlers.redo_post.remove(h)
+
+        if(h.__name__=='nodebooster_handler_renderinit'):
+            bpy.app.handlers.render_init.remove(h)
+
+        if(h.__name__=='nodebooster_handler_rendercomplete'):
+            if (h in bpy.app.handlers.render_complete):
+                bpy.app.handlers.render_complete.remove(h)
+            if (h in bpy.app.handlers.render_cancel):
+                bpy.app.handlers.render_cancel.remove(h)
+
     return None
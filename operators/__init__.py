@@ -6,7 +6,7 @@
 import bpy
 
 from .drawroute import NODEBOOSTER_OT_draw_route
-from .bake import NODEBOOSTER_OT_bake_customnode
+from .bake import NODEBOOSTER_OT_bake_customnode, NODEBOOSTER_OT_bake_sequencer_volume
 from .purge import NODEBOOSTER_OT_node_purge_unused
 from .favorites import NODEBOOSTER_OT_favorite_add, NODEBOOSTER_OT_favorite_loop
 from .depselect import NODEBOOSTER_OT_dependency_select
@@ -14,11 +14,13 @@ from .drawframes import NODEBOOSTER_OT_draw_frame
 from .chamfer import NODEBOOSTER_OT_chamfer
 from .palette import NODEBOOSTER_OT_setcolor, NODEBOOSTER_OT_palette_reset_color, NODEBOOSTER_OT_initalize_palette
 from .codetemplates import NODEBOOSTER_OT_text_templates
+from .profiler import NODEBOOSTER_OT_profile_reset, NODEBOOSTER_OT_profile_export
 
 classes = (
 
     NODEBOOSTER_OT_draw_route,
     NODEBOOSTER_OT_bake_customnode,
+    NODEBOOSTER_OT_bake_sequencer_volume,
     NODEBOOSTER_OT_node_purge_unused,
     NODEBOOSTER_OT_favorite_add,
     NODEBOOSTER_OT_favorite_loop,
@@ -29,6 +31,8 @@ classes = (
     NODEBOOSTER_OT_palette_reset_color,
     NODEBOOSTER_OT_initalize_palette,
     NODEBOOSTER_OT_text_templates,
+    NODEBOOSTER_OT_profile_reset,
+    NODEBOOSTER_OT_profile_export,
 
     )
 
@@ -58,3 +58,43 @@ class NODEBOOSTER_OT_bake_customnode(bpy.types.Operator):
         self.report({'INFO'}, f"Replaced node '{self.node_name}' with node group '{self.node_name}'")
 
         return {'FINISHED'}
+
+
+class NODEBOOSTER_OT_bake_sequencer_volume(bpy.types.Operator):
+    """Bake the Sequencer Volume node outputs over the scene frame range, the node will then read these values instead of analyzing the sounds"""
+
+    bl_idname = "nodebooster.bake_sequencer_volume"
+    bl_label = "Bake Sequencer Volume"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    node_name: bpy.props.StringProperty()
+    clear: bpy.props.BoolProperty(
+        default=False,
+        description="Remove the baked values",
+        )
+
+    @classmethod
+    def poll(cls, context):
+        return (context.space_data.type=='NODE_EDITOR') and (context.space_data.node_tree is not None)
+
+    def execute(self, context):
+
+        node_tree = context.space_data.edit_tree
+        node = node_tree.nodes.get(self.node_name)
+        if (node is None) or (node.bl_idname!="GeometryNodeNodeBoosterSequencerVolume"):
+            self.report({'ERROR'}, "Sequencer Volume node with given name not found")
+            return {'CANCELLED'}
+
+        if (self.clear):
+            node.clear_baked_values()
+            node.update()
+            self.report({'INFO'}, f"Cleared baked values of '{self.node_name}'")
+            return {'FINISHED'}
+
+        scene = context.scene
+        node.bake_values(scene.frame_start, scene.frame_end,)
+        node.update()
+
+        self.report({'INFO'}, f"Baked '{self.node_name}' from frame {scene.frame_start} to {scene.frame_end}")
+
+        return {'FINISHED'}
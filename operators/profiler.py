@@ -0,0 +1,66 @@
+# SPDX-FileCopyrightText: 2025 BD3D DIGITAL DESIGN (Dorian B.)
+#
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+
+import bpy
+
+import os
+
+from ..utils.profiler_utils import reset_profile, export_profile_json, export_profile_chrome
+
+
+class NODEBOOSTER_OT_profile_reset(bpy.types.Operator):
+    """Clear the recorded timings of the booster nodes"""
+
+    bl_idname = "nodebooster.profile_reset"
+    bl_label = "Reset Profiling"
+    bl_options = {'REGISTER'}
+
+    def execute(self, context):
+
+        reset_profile()
+
+        return {'FINISHED'}
+
+
+class NODEBOOSTER_OT_profile_export(bpy.types.Operator):
+    """Export the recorded timings of the booster nodes"""
+
+    bl_idname = "nodebooster.profile_export"
+    bl_label = "Export Profiling"
+    bl_options = {'REGISTER'}
+
+    filepath : bpy.props.StringProperty(
+        subtype="FILE_PATH",
+        )
+    file_format : bpy.props.EnumProperty(
+        name="Format",
+        items=(("JSON", "JSON", "Stats of each handler, node class & node: call count, total, mean, p50, p95 & max durations in milliseconds",),
+               ("CHROME", "Chrome Trace", "Every recorded call as a trace event, open it in 'chrome://tracing' or https://ui.perfetto.dev",),),
+        default="JSON",
+        )
+
+    def invoke(self, context, event):
+
+        if (not self.filepath):
+            name = "nodebooster_trace" if (self.file_format=="CHROME") else "nodebooster_profile"
+            self.filepath = f"{name}.json"
+
+        context.window_manager.fileselect_add(self)
+        return {'RUNNING_MODAL'}
+
+    def execute(self, context):
+
+        filepath = bpy.path.ensure_ext(bpy.path.abspath(self.filepath), ".json")
+        if (not os.path.isdir(os.path.dirname(filepath))):
+            self.report({'ERROR'}, f"Directory not found: {os.path.dirname(filepath)}")
+            return {'CANCELLED'}
+
+        if (self.file_format=="CHROME"):
+              export_profile_chrome(filepath)
+        else: export_profile_json(filepath)
+
+        self.report({'INFO'}, f"Profiling exported to '{filepath}'")
+
+        return {'FINISHED'}
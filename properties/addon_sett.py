@@ -5,6 +5,8 @@
 
 import bpy 
 
+from ..utils.profiler_utils import set_profiling, get_profile_stats
+
 
 class NODEBOOSTER_AddonPref(bpy.types.AddonPreferences):
 
@@ -19,6 +21,43 @@ class NODEBOOSTER_AddonPref(bpy.types.AddonPreferences):
         name="Depsgraph Debug",
         default=False,
         )
+    debug_profiling : bpy.props.BoolProperty(
+        name="Profiling",
+        description="Record the time spent in our handlers, in the update of each node type and in the evaluation of each node. Find out which node makes your scene slow",
+        default=False,
+        update=lambda self, context: set_profiling(self.debug_profiling),
+        )
+    handlers_min_interval : bpy.props.FloatProperty(
+        name="Refresh Interval",
+        description="Minimal interval between two refreshes of the booster nodes on depsgraph updates. The updates happening in between are coalesced into a single refresh. Set to 0 to refresh immediately on each update",
+        default=0.05,
+        min=0.0,
+        soft_max=1.0,
+        subtype='TIME_ABSOLUTE',
+        )
+    handlers_time_budget : bpy.props.FloatProperty(
+        name="Time Budget (ms)",
+        description="Maximal time spent refreshing the booster nodes per event loop tick. The nodes that don't fit are refreshed on the next tick, the interface stays responsive",
+        default=10.0,
+        min=1.0,
+        soft_max=100.0,
+        )
+    use_expression_tracer : bpy.props.BoolProperty(
+        name="Trace Python Expressions",
+        description="Python Expressions only re-evaluate when the data they depend on is updated. When their dependencies can't be found by analyzing the expression, record the data they access while evaluating. Slower evaluation, and a few python idioms such as isinstance() checks on blender data may not behave as expected",
+        default=False,
+        )
+    use_audio_disk_cache : bpy.props.BoolProperty(
+        name="Cache Sound Analysis on Disk",
+        description="Store the analyzed sound levels used by the Sequencer Volume node on disk, so sounds are never decoded twice across sessions",
+        default=True,
+        )
+    audio_cache_dir : bpy.props.StringProperty(
+        name="Cache Directory",
+        description="Directory where the sound analysis are stored. Leave empty to use the extension user directory. Render workers may share a same directory",
+        subtype='DIR_PATH',
+        default="",
+        )
     #not exposed
     ui_word_wrap_max_char_factor : bpy.props.FloatProperty(
         default=1.0,
@@ -37,7 +76,67 @@ class NODEBOOSTER_AddonPref(bpy.types.AddonPreferences):
         
         layout = self.layout
         
+        col = layout.column(align=True)
+        col.prop(self,"handlers_min_interval",)
+        sub = col.column(align=True)
+        sub.active = (self.handlers_min_interval>0)
+        sub.prop(self,"handlers_time_budget",)
+        col.separator()
+        col.prop(self,"use_expression_tracer",)
+
+        col = layout.column()
+        col.prop(self,"use_audio_disk_cache",)
+        sub = col.column()
+        sub.active = self.use_audio_disk_cache
+        sub.prop(self,"audio_cache_dir",)
+
         layout.prop(self,"debug",)
         layout.prop(self,"debug_depsgraph",)
-        
+
+        if (self.debug):
+            from ..utils.node_utils import WRITE_STATS
+            col = layout.column(align=True)
+            col.active = False
+            col.label(text=f"Socket Writes Applied: {WRITE_STATS['applied']}")
+            col.label(text=f"Socket Writes Skipped: {WRITE_STATS['skipped']}")
+
+        layout.prop(self,"debug_profiling",)
+
+        if (self.debug_profiling):
+            self.draw_profiling(layout)
+
+        return None
+
+    def draw_profiling(self, layout, max_rows=32,):
+        """draw the recorded timings, sorted by cost"""
+
+        box = layout.box()
+
+        row = box.row(align=True)
+        row.operator("nodebooster.profile_reset", text="Reset", icon="TRASH",)
+        row.operator("nodebooster.profile_export", text="Export JSON", icon="EXPORT",).file_format = "JSON"
+        row.operator("nodebooster.profile_export", text="Export Chrome Trace", icon="EXPORT",).file_format = "CHROME"
+
+        stats = get_profile_stats()
+        if (not stats):
+            box.label(text="Nothing recorded yet. Scrub the timeline or interact with your scene.")
+            return None
+
+        grid = box.grid_flow(row_major=True, columns=7, even_columns=False, align=True,)
+        for title in ("Name", "Calls", "Total ms", "p50", "p95", "Max", "Type"):
+            grid.label(text=title)
+
+        for s in stats[:max_rows]:
+            grid.label(text=s['name'])
+            grid.label(text=str(s['count']))
+            grid.label(text=f"{s['total']:.2f}")
+            grid.label(text=f"{s['p50']:.3f}")
+            grid.label(text=f"{s['p95']:.3f}")
+            grid.label(text=f"{s['max']:.3f}")
+            grid.label(text=s['category'])
+            continue
+
+        if (len(stats)>max_rows):
+            box.label(text=f"{len(stats)-max_rows} more entries, export to see them all.")
+
         return None
@@ -184,7 +184,7 @@ class NODEBOOSTER_PT_active_node(bpy.types.Panel):
                     panel.prop(sett_win,"allow_auto_exec")
                     
                     prop = panel.column()
-                    prop.enabled = sett_win.allow_auto_exec
+                    prop.enabled = sett_win.allow_auto_exec or n.is_safe_expression()
                     prop.prop(n,"execute_at_depsgraph")
                 
             
@@ -302,7 +302,7 @@ class NODEBOOSTER_PT_active_node(bpy.types.Panel):
                     panel.prop(sett_win,"allow_auto_exec")
                     
                     prop = panel.column()
-                    prop.enabled = sett_win.allow_auto_exec
+                    prop.enabled = sett_win.allow_auto_exec or n.is_safe_expression()
                     prop.prop(n,"execute_at_depsgraph")
 
                 header, panel = layout.panel("doc_panelid", default_closed=True,)
@@ -341,6 +341,44 @@ class NODEBOOSTER_PT_active_node(bpy.types.Panel):
 
             case 'GeometryNodeNodeBoosterSequencerVolume':
 
+                header, panel = layout.panel("params_panelid", default_closed=False,)
+                header.label(text="Parameters",)
+                if (panel):
+
+                    panel.prop(n, "envelope_type",)
+                    panel.prop(n, "frame_delay",)
+                    panel.prop(n, "smoothing_window",)
+                    
+                    col = panel.column(align=True)
+                    col.prop(n, "band_count",)
+                    sub = col.column(align=True)
+                    sub.active = bool(n.band_count)
+                    sub.prop(n, "band_freq_min",)
+                    sub.prop(n, "band_freq_max",)
+
+                    col = panel.column(align=True)
+                    col.prop(n, "filter_channels", placeholder="All Channels",)
+                    col.prop(n, "filter_names", placeholder="All Strips",)
+
+                header, panel = layout.panel("bake_panelid", default_closed=True,)
+                header.label(text="Bake",)
+                if (panel):
+
+                    col = panel.column(align=True)
+                    row = col.row(align=True)
+                    op = row.operator("nodebooster.bake_sequencer_volume", text="Bake Frame Range", icon="RENDER_ANIMATION",)
+                    op.node_name = n.name
+                    op.clear = False
+                    if (n.is_baked()):
+                        op = row.operator("nodebooster.bake_sequencer_volume", text="", icon="TRASH",)
+                        op.node_name = n.name
+                        op.clear = True
+
+                    prop = col.column()
+                    prop.enabled = n.is_baked()
+                    prop.prop(n, "use_baked",)
+
+
                 header, panel = layout.panel("doc_panelid", default_closed=True,)
                 header.label(text="Documentation",)
                 if (panel):
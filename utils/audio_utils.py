@@ -0,0 +1,443 @@
+# SPDX-FileCopyrightText: 2025 BD3D DIGITAL DESIGN (Dorian B.)
+#
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+
+#NOTE Decoding audio is slow, we don't want to do it on each frame for each sound strips.
+#     Instead we decode each sound datablock once and store a compact per-frame envelope of it.
+#     - An envelope is a float32 numpy array of shape (frames, 2), columns are the peak and rms levels.
+#     - Envelope row 'i' covers the time interval [i/fps, (i+1)/fps] of the sound.
+#     - Spectrograms are analyzed & cached the same way. A spectrogram is a float32 array of shape (frames, SPECTROGRAM_BINS),
+#       the per-frame peak amplitude of log-spaced frequency bins, see get_spectrogram_frequencies().
+#     - Envelopes are kept in a LRU cache, keyed by sound, fps and sample settings.
+#     - A cumulative-sum prefix array of each envelope is computed lazily, for O(1) windowed averages.
+#     - Envelopes are also written to a cache directory as flat binary arrays, and loaded back with numpy.memmap
+#       so we skip decoding entirely across sessions, and workers rendering the same shot share the OS page cache.
+#     - When the UI is running, the envelopes are computed by a pool of worker threads. Results are handed back
+#       to the main thread with a bpy.app.timers poll. Meanwhile, sounds are sampled on demand, one frame at a time.
+#       In background mode (renders) the envelopes are computed synchronously, renders need to be deterministic.
+
+
+import bpy
+
+import os
+import hashlib
+import tempfile
+import numpy as np
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from .. import get_addon_prefs
+from .. import __package__ as base_package
+
+
+ENVELOPE_PEAK = 0
+ENVELOPE_RMS = 1
+
+ENVELOPE_CACHE_MAX = 64               #max number of envelopes kept in memory
+ENVELOPE_CHUNK_FRAMES = 2048          #decode the sound by chunks of frames, we don't want to load a whole soundtrack in memory
+
+ENVELOPE_CACHE = OrderedDict()        #{key: np.ndarray}
+ENVELOPE_PREFIX = {}                  #{id(envelope): (envelope, prefix np.ndarray)}
+ENVELOPE_WORKERS_MAX = 2
+ENVELOPE_POLL_INTERVAL = 0.1
+
+ENVELOPE_PENDING = {}                 #{key: (Future, [callbacks])}
+ENVELOPE_EXECUTOR = {'pool':None}
+
+SPECTROGRAM_BINS = 64
+SPECTROGRAM_FMIN = 20.0
+SPECTROGRAM_FMAX = 20000.0
+
+
+def get_sound_factory(sound, depsgraph=None,):
+    """get the aud.Sound factory of a sound datablock"""
+
+    if (depsgraph is None):
+        depsgraph = bpy.context.evaluated_depsgraph_get()
+
+    return sound.evaluated_get(depsgraph).factory
+
+
+def get_envelope_key(sound, fps, factory, kind='ENVELOPE',):
+    """get the key of a sound envelope"""
+
+    rate, channels = factory.specs
+    return (kind, sound.name_full, bpy.path.abspath(sound.filepath), round(fps,6), int(rate), int(channels),)
+
+
+def iter_sound_chunks(factory, fps,):
+    """decode the given aud.Sound factory by chunks of frames.
+    yield the (samples, channels) float32 data of each chunk & the start sample of each frame within it"""
+
+    rate, _ = factory.specs
+    samples_per_frame = rate / fps
+    chunk_idx = 0
+
+    while True:
+
+        frame_from = chunk_idx * ENVELOPE_CHUNK_FRAMES
+        frame_to = frame_from + ENVELOPE_CHUNK_FRAMES
+
+        data = factory.limit(frame_from/fps, frame_to/fps).data()
+        if (len(data)==0):
+            break
+
+        data = np.asarray(data, dtype=np.float32)
+        if (data.ndim==1):
+            data = data[:,None]
+
+        #find the start sample of each frame of this chunk
+        starts = np.round(np.arange(ENVELOPE_CHUNK_FRAMES) * samples_per_frame).astype(np.int64)
+        starts = starts[starts<len(data)]
+
+        yield data, starts
+
+        #last chunk was incomplete, we reached the end of the sound
+        if (len(starts)<ENVELOPE_CHUNK_FRAMES):
+            break
+
+        chunk_idx += 1
+        continue
+
+    return None
+
+
+def compute_envelope(factory, fps,):
+    """decode the given aud.Sound factory and compute its per-frame peak/rms envelope"""
+
+    chunks = []
+
+    for data, starts in iter_sound_chunks(factory, fps):
+
+        #mix all channels together, we only care about the levels
+        data = np.abs(data).max(axis=1)
+
+        peak = np.maximum.reduceat(data, starts)
+        counts = np.diff(np.append(starts, len(data)))
+        rms = np.sqrt(np.add.reduceat(data*data, starts) / counts)
+
+        chunks.append(np.stack((peak, rms), axis=1))
+        continue
+
+    if (not chunks):
+        return np.zeros((0,2), dtype=np.float32)
+
+    return np.concatenate(chunks).astype(np.float32)
+
+
+def get_spectrogram_frequencies():
+    """get the (SPECTROGRAM_BINS+1) frequency edges of our spectrogram bins, log-spaced"""
+
+    return np.geomspace(SPECTROGRAM_FMIN, SPECTROGRAM_FMAX, SPECTROGRAM_BINS+1)
+
+
+def compute_spectrogram(factory, fps,):
+    """decode the given aud.Sound factory and compute its per-frame spectrogram, with a vectorized STFT"""
+
+    rate, _ = factory.specs
+    samples_per_frame = rate / fps
+
+    #one hann-windowed fft per frame, covering the whole frame
+    n_fft = 1 << int(np.ceil(np.log2(max(samples_per_frame, 2))))
+    window = np.hanning(n_fft).astype(np.float32)
+    #normalize so a sine of amplitude 1 peaks at 1
+    norm = 2.0 / window.sum()
+
+    #map each fft bin to one of our log-spaced bins
+    freqs = np.fft.rfftfreq(n_fft, d=1.0/rate)
+    bands = get_spectrogram_frequencies()
+    edges = np.clip(np.searchsorted(freqs, bands), 1, len(freqs)-1)[:-1]
+    audible = (bands[:-1] < rate/2).astype(np.float32)
+
+    chunks = []
+
+    for data, starts in iter_sound_chunks(factory, fps):
+
+        #mono mix, zero padded so each frame can read n_fft samples
+        data = np.concatenate((data.mean(axis=1), np.zeros(n_fft, dtype=np.float32)))
+
+        segments = data[starts[:,None] + np.arange(n_fft)[None,:]] * window
+        magnitudes = np.abs(np.fft.rfft(segments, axis=1)) * norm
+
+        chunks.append(np.maximum.reduceat(magnitudes, edges, axis=1) * audible)
+        continue
+
+    if (not chunks):
+        return np.zeros((0,SPECTROGRAM_BINS), dtype=np.float32)
+
+    return np.concatenate(chunks).astype(np.float32)
+
+
+ANALYSIS_KINDS = {
+    'ENVELOPE':    {'compute':compute_envelope,    'columns':2,                'ext':'env',},
+    'SPECTROGRAM': {'compute':compute_spectrogram, 'columns':SPECTROGRAM_BINS, 'ext':'spc',},
+    }
+
+
+def get_envelope_cache_dir():
+    """get the directory where the envelopes are stored on disk"""
+
+    sett_plugin = get_addon_prefs()
+    if (sett_plugin.audio_cache_dir):
+        return bpy.path.abspath(sett_plugin.audio_cache_dir)
+
+    try:
+        return bpy.utils.extension_path_user(base_package, path="envelopes", create=True)
+    except Exception:
+        #legacy addon installation? extension paths are not available.
+        return os.path.join(tempfile.gettempdir(), "nodebooster_envelopes")
+
+
+def get_envelope_filepath(sound, fps, factory, kind='ENVELOPE',):
+    """get the disk cache filepath of a sound envelope, None if the sound has no file to identify it with (packed or missing)"""
+
+    if (sound.packed_file is not None):
+        return None
+
+    soundpath = bpy.path.abspath(sound.filepath)
+    if (not os.path.isfile(soundpath)):
+        return None
+
+    rate, channels = factory.specs
+    mtime = os.path.getmtime(soundpath)
+    stamp = f"{os.path.normpath(soundpath)}|{mtime}|{round(fps,6)}|{rate}|{channels}|{ENVELOPE_CHUNK_FRAMES}|{ANALYSIS_KINDS[kind]['columns']}"
+    digest = hashlib.sha1(stamp.encode('utf-8')).hexdigest()
+
+    return os.path.join(get_envelope_cache_dir(), f"{digest}.{ANALYSIS_KINDS[kind]['ext']}")
+
+
+def read_envelope_file(filepath, columns=2,):
+    """memory-map an envelope from disk, None if not existing"""
+
+    if (filepath is None) or (not os.path.isfile(filepath)):
+        return None
+
+    if (os.path.getsize(filepath)==0):
+        return np.zeros((0,columns), dtype=np.float32)
+
+    try:
+        return np.memmap(filepath, dtype=np.float32, mode='r').reshape(-1,columns)
+    except Exception as e:
+        print(f"WARNING: read_envelope_file(): couldn't read '{filepath}':\n{e}")
+        return None
+
+
+def write_envelope_file(filepath, envelope,):
+    """write an envelope to disk as a flat float32 array"""
+
+    if (filepath is None):
+        return None
+
+    try:
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        #we write in a temporary file first, other processes may be reading this cache concurrently
+        tmppath = f"{filepath}.{os.getpid()}.tmp"
+        np.ascontiguousarray(envelope, dtype=np.float32).tofile(tmppath)
+        os.replace(tmppath, filepath)
+    except Exception as e:
+        print(f"WARNING: write_envelope_file(): couldn't write '{filepath}':\n{e}")
+
+    return None
+
+
+def store_envelope(key, envelope,):
+    """store an envelope in our memory cache"""
+
+    ENVELOPE_CACHE[key] = envelope
+
+    #LRU eviction
+    while (len(ENVELOPE_CACHE)>ENVELOPE_CACHE_MAX):
+        _, evicted = ENVELOPE_CACHE.popitem(last=False)
+        ENVELOPE_PREFIX.pop(id(evicted), None)
+
+    return None
+
+
+def envelope_worker(factory, fps, filepath, kind='ENVELOPE',):
+    """compute & write an envelope, run from a worker thread. No bpy access allowed in here"""
+
+    envelope = ANALYSIS_KINDS[kind]['compute'](factory, fps)
+    write_envelope_file(filepath, envelope)
+
+    return envelope
+
+
+def envelope_timer():
+    """bpy.app.timers callback, hand the computed envelopes back to the main thread"""
+
+    for key, (future, callbacks) in list(ENVELOPE_PENDING.items()):
+
+        if (not future.done()):
+            continue
+
+        del ENVELOPE_PENDING[key]
+
+        try:
+            store_envelope(key, future.result())
+        except Exception as e:
+            print(f"WARNING: envelope_timer(): sound analysis failed:\n{e}")
+            continue
+
+        for callback in callbacks:
+            callback()
+
+        continue
+
+    #keep polling as long as there's work left
+    if (ENVELOPE_PENDING):
+        return ENVELOPE_POLL_INTERVAL
+    return None
+
+
+def ensure_envelope_timer():
+    """make sure our timer is polling the pending analysis. persistent, blender would drop it on file load otherwise"""
+
+    if (ENVELOPE_PENDING) and (not bpy.app.timers.is_registered(envelope_timer)):
+        bpy.app.timers.register(envelope_timer, first_interval=ENVELOPE_POLL_INTERVAL, persistent=True,)
+
+    return None
+
+
+def get_sound_envelope(sound, fps, depsgraph=None, asynchronous=False, on_ready=None, kind='ENVELOPE',):
+    """get the envelope of a sound datablock, compute it if not cached yet.
+    if asynchronous, the envelope is computed in a worker thread and None is returned until it's ready,
+    the optional on_ready callback will then be called from the main thread"""
+
+    factory = get_sound_factory(sound, depsgraph=depsgraph)
+    key = get_envelope_key(sound, fps, factory, kind=kind)
+
+    envelope = ENVELOPE_CACHE.get(key)
+    if (envelope is not None):
+        ENVELOPE_CACHE.move_to_end(key)
+        return envelope
+
+    #still being computed?
+    pending = ENVELOPE_PENDING.get(key)
+    if (pending is not None):
+        if (on_ready and on_ready not in pending[1]):
+            pending[1].append(on_ready)
+        ensure_envelope_timer()
+        return None
+
+    use_disk = get_addon_prefs().use_audio_disk_cache
+    filepath = get_envelope_filepath(sound, fps, factory, kind=kind) if use_disk else None
+
+    envelope = read_envelope_file(filepath, columns=ANALYSIS_KINDS[kind]['columns'])
+    if (envelope is not None):
+        store_envelope(key, envelope)
+        return envelope
+
+    #background mode, there's no event loop for our timers
+    if (not asynchronous or bpy.app.background):
+        envelope = envelope_worker(factory, fps, filepath, kind=kind)
+        store_envelope(key, envelope)
+        return envelope
+
+    if (ENVELOPE_EXECUTOR['pool'] is None):
+        ENVELOPE_EXECUTOR['pool'] = ThreadPoolExecutor(max_workers=ENVELOPE_WORKERS_MAX, thread_name_prefix="NodeBoosterAudio",)
+
+    future = ENVELOPE_EXECUTOR['pool'].submit(envelope_worker, factory, fps, filepath, kind,)
+    ENVELOPE_PENDING[key] = (future, [on_ready] if on_ready else [])
+    ensure_envelope_timer()
+
+    return None
+
+
+def get_sound_spectrogram(sound, fps, depsgraph=None, asynchronous=False, on_ready=None,):
+    """get the spectrogram of a sound datablock, see get_sound_envelope()"""
+
+    return get_sound_envelope(sound, fps, depsgraph=depsgraph, asynchronous=asynchronous, on_ready=on_ready, kind='SPECTROGRAM',)
+
+
+def sample_sound_on_demand(sound, fps, idx, column=ENVELOPE_PEAK, depsgraph=None,):
+    """decode & measure a single frame of a sound, for when its envelope is not available yet"""
+
+    factory = get_sound_factory(sound, depsgraph=depsgraph)
+    chunk = factory.limit(idx/fps, (idx+1)/fps).data()
+
+    #sometimes the chunks cannot be read properly, try to read 2 frames instead
+    if (len(chunk)==0):
+        chunk = factory.limit((idx-1)/fps, (idx+1)/fps).data()
+    if (len(chunk)==0):
+        return 0.0
+
+    chunk = np.abs(np.asarray(chunk, dtype=np.float32))
+    if (column==ENVELOPE_RMS):
+        if (chunk.ndim>1):
+            chunk = chunk.max(axis=1)
+        return float(np.sqrt(np.mean(chunk*chunk)))
+
+    return float(chunk.max())
+
+
+def sample_envelope(envelope, idx, column=ENVELOPE_PEAK,):
+    """sample an envelope at given row index, return 0 if out of range"""
+
+    if (0 <= idx < len(envelope)):
+        return float(envelope[idx, column])
+    return 0.0
+
+
+def sample_envelope_range(envelope, indices, column=ENVELOPE_PEAK,):
+    """sample an envelope at given array of row indices, out of range indices are 0"""
+
+    levels = np.zeros(len(indices), dtype=np.float32)
+    valid = (indices>=0) & (indices<len(envelope))
+    levels[valid] = envelope[indices[valid], column]
+
+    return levels
+
+
+def get_envelope_prefix(envelope,):
+    """get the cumulative-sum prefix array of an envelope, shape (frames+1, columns). prefix[i] is the sum of rows [0, i["""
+
+    entry = ENVELOPE_PREFIX.get(id(envelope))
+    if (entry is not None) and (entry[0] is envelope):
+        return entry[1]
+
+    prefix = np.zeros((len(envelope)+1, envelope.shape[1]), dtype=np.float64)
+    np.cumsum(envelope, axis=0, dtype=np.float64, out=prefix[1:])
+    ENVELOPE_PREFIX[id(envelope)] = (envelope, prefix)
+
+    return prefix
+
+
+def sample_envelope_window(envelope, lo, hi, window, column=ENVELOPE_PEAK,):
+    """average an envelope over the rows [lo, hi] divided by the window size, in O(1).
+    lo & hi may be ints or arrays of ints, column may be an int or a slice. out of range rows count as silence"""
+
+    prefix = get_envelope_prefix(envelope)
+    n = len(envelope)
+
+    lo = np.clip(lo, 0, n)
+    hi = np.clip(np.asarray(hi)+1, lo, n)
+    levels = (prefix[hi, column] - prefix[lo, column]) / window
+
+    return levels.astype(np.float32) if isinstance(levels, np.ndarray) else float(levels)
+
+
+def clear_envelope_cache():
+    """free all envelopes from memory"""
+
+    ENVELOPE_CACHE.clear()
+    ENVELOPE_PREFIX.clear()
+    return None
+
+
+def unload_envelope_workers():
+    """stop our worker threads & timer, pending analysis are abandoned"""
+
+    if (bpy.app.timers.is_registered(envelope_timer)):
+        bpy.app.timers.unregister(envelope_timer)
+
+    for future, _ in ENVELOPE_PENDING.values():
+        future.cancel()
+    ENVELOPE_PENDING.clear()
+
+    if (ENVELOPE_EXECUTOR['pool'] is not None):
+        ENVELOPE_EXECUTOR['pool'].shutdown(wait=False)
+        ENVELOPE_EXECUTOR['pool'] = None
+
+    return None
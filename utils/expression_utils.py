@@ -0,0 +1,531 @@
+# SPDX-FileCopyrightText: 2025 BD3D DIGITAL DESIGN (Dorian B.)
+#
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+
+#NOTE Most python expressions only depend on a few datablocks, ex: "D.objects['Cube'].location.z".
+#     We find out which IDs an expression touches, so it's only re-evaluated when one of them is updated by the depsgraph.
+#      - Static analysis: we parse the expression and resolve its attributes chains rooted on our namespace names,
+#        such as 'D', 'scene', 'self', 'C.scene'. Reading properties has no side effects. Each struct met along the way
+#        tells us its owner ID. If a chain can't be resolved statically (calls on blender data, iteration over
+#        collections, context dependent members) the dependencies are unknown and the expression is always evaluated.
+#      - Optional tracer: the expression is evaluated with the blender data wrapped in proxies recording the IDs they
+#        own. Slower and not fully transparent (ex: isinstance() checks on proxies), so it's opt-in from the preferences.
+#     An expression is also frame dependent if it reads a frame property, uses the random module, reads derived data
+#     (ex: 'matrix_world', which may change with parents, constraints or simulations), or depends on animated IDs,
+#     directly or through their parents & constraints targets. An ID with drivers is always considered animated.
+
+
+import bpy
+
+import ast
+import math
+import random
+import operator
+import mathutils
+
+from functools import lru_cache
+
+
+FRAME_ATTRIBUTES = {'frame_current', 'frame_float', 'frame_current_final', 'frame_subframe',}
+DERIVED_ATTRIBUTES = {'matrix_world', 'matrix_local', 'matrix', 'matrix_channel', 'dimensions', 'bound_box', 'head', 'tail',}
+RANDOM_NAMES = {k for k,v in vars(random).items() if callable(v) and not k.startswith('_')} - set(vars(math))
+CONTEXT_NAMES = {'C', 'context',}
+CONTEXT_STATIC_MEMBERS = {'scene', 'view_layer', 'window_manager', 'preferences',}
+
+UNRESOLVED = object()
+
+
+@lru_cache(maxsize=1024)
+def parse_expression(expression:str,):
+    """parse a python expression once, the trees are cached by expression string. None if invalid"""
+
+    try:
+        return ast.parse(expression, mode='eval')
+    except SyntaxError:
+        return None
+
+
+def is_blender_data(value):
+    """check if a value is blender data, which may lead to other IDs"""
+
+    return isinstance(value, (bpy.types.bpy_struct, bpy.types.bpy_prop_collection))
+
+
+def get_owner_id(value):
+    """get the ID owning a blender struct, if any"""
+
+    if isinstance(value, bpy.types.ID):
+        return value.original
+    if isinstance(value, bpy.types.bpy_struct):
+        id_data = value.id_data
+        if (id_data is not None):
+            return id_data.original
+    return None
+
+
+class DependencyAnalyzer(ast.NodeVisitor):
+    """resolve the attributes chains of an expression, gather the IDs they touch"""
+
+    def __init__(self, roots,):
+        self.roots = roots
+        self.ids = set()
+        self.dynamic = False
+        self.frame = False
+
+    def record(self, value):
+        owner = get_owner_id(value)
+        if (owner is not None):
+            self.ids.add(owner)
+        return None
+
+    def resolve(self, node):
+        """resolve an attributes/subscripts chain, return its value or UNRESOLVED"""
+
+        #flatten the chain, from the leaf to the root
+        steps = []
+        while isinstance(node, (ast.Attribute, ast.Subscript)):
+            if isinstance(node, ast.Attribute):
+                steps.append(('attr', node.attr))
+                if (node.attr in FRAME_ATTRIBUTES) or (node.attr in DERIVED_ATTRIBUTES):
+                    self.frame = True
+            elif isinstance(node.slice, ast.Constant):
+                steps.append(('item', node.slice.value))
+            else:
+                self.visit(node.slice)
+                steps.append(('dynamic', None))
+            node = node.value
+
+        if (not isinstance(node, ast.Name)):
+            self.visit(node)
+            #ex: D.objects.get('Cube').location, the call has been analyzed already
+            return UNRESOLVED
+
+        name = node.id
+        if (name in RANDOM_NAMES):
+            self.frame = True
+        if (name not in self.roots):
+            return UNRESOLVED
+
+        steps.reverse()
+
+        #the context members may change with the user selection, only a few of them are static
+        if (name in CONTEXT_NAMES) or ((name=='bpy') and steps and (steps[0]==('attr','context'))):
+            members = steps[1:] if (name=='bpy') else steps
+            if (not members) or (members[0][1] not in CONTEXT_STATIC_MEMBERS):
+                self.dynamic = True
+                return UNRESOLVED
+
+        #bpy.ops, bpy.utils, ect.. are not data
+        if (name=='bpy') and ((not steps) or (steps[0][1] not in {'data','context'})):
+            self.dynamic = True
+            return UNRESOLVED
+
+        #ex: 'self' not available or ambiguous, it may become available later
+        value = self.roots[name]
+        if (value is None):
+            self.dynamic = True
+            return UNRESOLVED
+        self.record(value)
+
+        for kind, key in steps:
+            if (kind=='dynamic'):
+                if is_blender_data(value):
+                    self.dynamic = True
+                return UNRESOLVED
+            try:
+                value = getattr(value, key) if (kind=='attr') else value[key]
+            except Exception:
+                #will most likely raise on evaluation as well
+                self.dynamic = True
+                return UNRESOLVED
+            self.record(value)
+            continue
+
+        return value
+
+    def visit_Name(self, node):
+        self.resolve(node)
+
+    def visit_Attribute(self, node):
+        value = self.resolve(node)
+        #a collection used as is, iterated, passed to a function..
+        if isinstance(value, bpy.types.bpy_prop_collection):
+            self.dynamic = True
+
+    def visit_Subscript(self, node):
+        self.visit_Attribute(node)
+
+    def visit_Call(self, node):
+        #calls on blender data may return any other data
+        if isinstance(node.func, ast.Attribute):
+            receiver = self.resolve(node.func.value)
+            if is_blender_data(receiver) or (receiver is bpy):
+                self.dynamic = True
+        else:
+            self.visit(node.func)
+        for arg in node.args:
+            self.visit(arg)
+        for kw in node.keywords:
+            self.visit(kw.value)
+
+
+def analyze_expression(expression:str, roots:dict,):
+    """find the IDs a python expression depends on, and if it depends on the frame.
+    return (set of IDs or None if unknown, is frame dependent)"""
+
+    tree = parse_expression(expression)
+    if (tree is None):
+        return None, True
+
+    analyzer = DependencyAnalyzer(roots)
+    analyzer.visit(tree)
+
+    if (analyzer.dynamic):
+        return None, True
+
+    return analyzer.ids, analyzer.frame
+
+
+def get_animation_sources(id_data):
+    """get the IDs which may move the given object when animated: its parent & constraints targets"""
+
+    sources = set()
+
+    if isinstance(id_data, bpy.types.Object):
+        if (id_data.parent is not None):
+            sources.add(id_data.parent.original)
+        constraints = list(id_data.constraints)
+        if (id_data.pose is not None):
+            constraints += [c for pb in id_data.pose.bones for c in pb.constraints]
+        for c in constraints:
+            target = getattr(c, 'target', None)
+            if (target is not None):
+                sources.add(target.original)
+            for t in getattr(c, 'targets', ()):
+                if (t.target is not None):
+                    sources.add(t.target.original)
+
+    return sources
+
+
+def is_animated(id_data):
+    """check if an ID has an action, nla tracks or drivers (their targets may be animated), or if any of its animation sources has, recursively"""
+
+    stack = [id_data]
+    visited = set()
+    while (stack):
+        id_data = stack.pop()
+        if (id_data in visited):
+            continue
+        visited.add(id_data)
+
+        anim = getattr(id_data, 'animation_data', None)
+        if (anim is not None) and ((anim.action is not None) or (len(anim.nla_tracks)>0) or (len(anim.drivers)>0)):
+            return True
+
+        #simulated by the rigid body world
+        if isinstance(id_data, bpy.types.Object) and (id_data.rigid_body is not None):
+            return True
+
+        stack.extend(get_animation_sources(id_data))
+        continue
+
+    return False
+
+
+# Optional tracer
+
+
+class TracedData():
+    """proxy of a blender data, recording the IDs owning the data accessed through it"""
+
+    __slots__ = ('_value', '_ids',)
+
+    def __init__(self, value, ids,):
+        object.__setattr__(self, '_value', value)
+        object.__setattr__(self, '_ids', ids)
+
+    def __getattr__(self, name):
+        return trace_value(getattr(self._value, name), self._ids)
+
+    def __getitem__(self, key):
+        return trace_value(self._value[untrace_value(key)], self._ids)
+
+    def __iter__(self):
+        for v in self._value:
+            yield trace_value(v, self._ids)
+
+    def __len__(self):
+        return len(self._value)
+
+    def __contains__(self, item):
+        return untrace_value(item) in self._value
+
+    def __call__(self, *args, **kwargs):
+        args = [untrace_value(a) for a in args]
+        kwargs = {k:untrace_value(v) for k,v in kwargs.items()}
+        return trace_value(self._value(*args, **kwargs), self._ids)
+
+    def __eq__(self, other):
+        return self._value==untrace_value(other)
+
+    def __hash__(self):
+        return hash(self._value)
+
+    def __bool__(self):
+        return bool(self._value)
+
+    def __repr__(self):
+        return repr(self._value)
+
+
+def trace_value(value, ids,):
+    """wrap the blender data in a recording proxy, record its owner ID"""
+
+    if isinstance(value, TracedData):
+        return value
+
+    owner = get_owner_id(value)
+    if (owner is not None):
+        ids.add(owner)
+
+    if is_blender_data(value) or (callable(value) and not isinstance(value, type)):
+        return TracedData(value, ids)
+
+    return value
+
+
+def untrace_value(value):
+    """unwrap a proxy, and the proxies in a list/tuple/set"""
+
+    if isinstance(value, TracedData):
+        return value._value
+    if isinstance(value, (list, tuple, set)):
+        return type(value)(untrace_value(v) for v in value)
+    return value
+
+
+def evaluate_traced(code, namespace:dict, names,):
+    """evaluate a code object with the given namespace names wrapped in recording proxies.
+    return (evaluated value, set of touched IDs)"""
+
+    ids = set()
+    traced = {k:trace_value(v, ids) for k,v in namespace.items() if (k in names)}
+    value = eval(code, {}, {**namespace, **traced},)
+
+    return untrace_value(value), ids
+
+
+# Fast evaluator
+
+
+#NOTE Many expressions are pure attributes chains and arithmetic, ex: "scene.frame_current * 0.1".
+#     We parse them once into a restricted AST and compile them into a chain of closures, skipping the eval machinery.
+#     Only a whitelist of nodes, names and pure functions is accepted, no private attributes. Nothing can be
+#     executed besides reading properties, so these expressions are safe to auto-run without 'allow_auto_exec':
+#      - our functions can't receive callables (ex: a bound method as 'max(key=)' or in a list), checked on each call.
+#      - no functions building huge results (ex: 'factorial'), the integers & sequences built by '*' & '**' are bounded,
+#        no string formatting through '%'.
+#     These runtime guards raise UnsafeExpression, the expression may then be evaluated through eval() with the user consent.
+#     Any other expression (method calls, comprehensions, lambdas..) is not compiled and falls back to eval().
+
+SAFE_NAMES = {'C', 'context', 'scene', 'self', 'D',}
+UNSAFE_MATH_FUNCTIONS = {'factorial', 'comb', 'perm', 'prod',}
+SAFE_FUNCTIONS = {
+    **{k:v for k,v in vars(math).items() if callable(v) and not k.startswith('_') and (k not in UNSAFE_MATH_FUNCTIONS)},
+    'abs':abs, 'min':min, 'max':max, 'round':round, 'int':int, 'float':float, 'bool':bool, 'len':len,
+    'Vector':mathutils.Vector, 'Color':mathutils.Color, 'Euler':mathutils.Euler, 'Quaternion':mathutils.Quaternion, 'Matrix':mathutils.Matrix,
+    }
+SAFE_CONSTANTS = {k:v for k,v in vars(math).items() if isinstance(v, float)}
+SAFE_INT_BITS = 1024                  #no huge integers, could freeze blender
+SAFE_SEQUENCE_MAX = 65_536            #no huge repeated sequences either
+
+BINARY_OPERATORS = {
+    ast.Add:operator.add, ast.Sub:operator.sub, ast.Div:operator.truediv,
+    ast.FloorDiv:operator.floordiv, ast.MatMult:operator.matmul,
+    }
+UNARY_OPERATORS = {ast.USub:operator.neg, ast.UAdd:operator.pos, ast.Not:operator.not_,}
+COMPARE_OPERATORS = {
+    ast.Eq:operator.eq, ast.NotEq:operator.ne, ast.Lt:operator.lt, ast.LtE:operator.le, ast.Gt:operator.gt, ast.GtE:operator.ge,
+    ast.Is:operator.is_, ast.IsNot:operator.is_not, ast.In:lambda a,b: a in b, ast.NotIn:lambda a,b: a not in b,
+    }
+
+
+class UnsafeExpression(Exception):
+    """the expression uses a python feature outside of our whitelist, or its evaluation was refused by our guards"""
+
+
+def safe_mul(a, b):
+    """multiplication operator, refusing huge integer or sequence results"""
+
+    if isinstance(a, int) and isinstance(b, int):
+        if (a.bit_length() + b.bit_length() > SAFE_INT_BITS):
+            raise UnsafeExpression(f"Integers above {SAFE_INT_BITS} bits not supported")
+
+    elif isinstance(a, (str, bytes, list, tuple)) and isinstance(b, int):
+        if (len(a) * b > SAFE_SEQUENCE_MAX):
+            raise UnsafeExpression(f"Sequences above {SAFE_SEQUENCE_MAX} items not supported")
+
+    elif isinstance(b, (str, bytes, list, tuple)) and isinstance(a, int):
+        return safe_mul(b, a)
+
+    return a * b
+
+
+def safe_pow(a, b):
+    """power operator, refusing huge integer results"""
+
+    if isinstance(a, int) and isinstance(b, int) and (b>0) and (abs(a)>1):
+        if (b * math.log2(abs(a)) > SAFE_INT_BITS):
+            raise UnsafeExpression(f"Integers above {SAFE_INT_BITS} bits not supported")
+    return a ** b
+
+
+def safe_mod(a, b):
+    """modulo operator, refusing string formatting (ex: '%0999999999d' % 1)"""
+
+    if isinstance(a, (str, bytes)):
+        raise UnsafeExpression("String formatting is not supported")
+    return a % b
+
+
+def safe_argument(value):
+    """refuse callables passed to our functions, they could be called (ex: 'max(key=)')"""
+
+    if callable(value):
+        raise UnsafeExpression("Callables are not supported as arguments")
+    return value
+
+
+def compile_fast_node(node):
+    """compile an AST node into a closure taking the namespace, raise UnsafeExpression if not whitelisted"""
+
+    match node:
+
+        case ast.Expression():
+            return compile_fast_node(node.body)
+
+        case ast.Constant():
+            value = node.value
+            return lambda ns: value
+
+        case ast.Name():
+            name = node.id
+            if (name in SAFE_NAMES):
+                def fct(ns):
+                    try:
+                        return ns[name]
+                    except KeyError:
+                        raise NameError(f"name '{name}' is not defined") from None
+                return fct
+            if (name in SAFE_CONSTANTS):
+                value = SAFE_CONSTANTS[name]
+                return lambda ns: value
+            if (name in SAFE_FUNCTIONS):
+                value = SAFE_FUNCTIONS[name]
+                return lambda ns: value
+            raise UnsafeExpression(name)
+
+        case ast.Attribute():
+            if node.attr.startswith('_'):
+                raise UnsafeExpression(node.attr)
+            value, attr = compile_fast_node(node.value), node.attr
+            return lambda ns: getattr(value(ns), attr)
+
+        case ast.Subscript():
+            if isinstance(node.slice, ast.Slice):
+                raise UnsafeExpression("slice")
+            value, key = compile_fast_node(node.value), compile_fast_node(node.slice)
+            return lambda ns: value(ns)[key(ns)]
+
+        case ast.BinOp():
+            left, right = compile_fast_node(node.left), compile_fast_node(node.right)
+            if isinstance(node.op, ast.Pow):
+                return lambda ns: safe_pow(left(ns), right(ns))
+            if isinstance(node.op, ast.Mult):
+                return lambda ns: safe_mul(left(ns), right(ns))
+            if isinstance(node.op, ast.Mod):
+                return lambda ns: safe_mod(left(ns), right(ns))
+            op = BINARY_OPERATORS.get(type(node.op))
+            if (op is None):
+                raise UnsafeExpression(type(node.op).__name__)
+            return lambda ns: op(left(ns), right(ns))
+
+        case ast.UnaryOp():
+            operand = compile_fast_node(node.operand)
+            op = UNARY_OPERATORS.get(type(node.op))
+            if (op is None):
+                raise UnsafeExpression(type(node.op).__name__)
+            return lambda ns: op(operand(ns))
+
+        case ast.BoolOp():
+            values = [compile_fast_node(v) for v in node.values]
+            if isinstance(node.op, ast.And):
+                def fct(ns):
+                    for v in values:
+                        result = v(ns)
+                        if (not result):
+                            return result
+                    return result
+            else:
+                def fct(ns):
+                    for v in values:
+                        result = v(ns)
+                        if (result):
+                            return result
+                    return result
+            return fct
+
+        case ast.Compare():
+            left = compile_fast_node(node.left)
+            ops = [COMPARE_OPERATORS[type(o)] for o in node.ops]
+            comparators = [compile_fast_node(c) for c in node.comparators]
+            def fct(ns):
+                a = left(ns)
+                for op, comparator in zip(ops, comparators):
+                    b = comparator(ns)
+                    if (not op(a, b)):
+                        return False
+                    a = b
+                return True
+            return fct
+
+        case ast.IfExp():
+            test, body, orelse = compile_fast_node(node.test), compile_fast_node(node.body), compile_fast_node(node.orelse)
+            return lambda ns: body(ns) if test(ns) else orelse(ns)
+
+        case ast.Tuple() | ast.List():
+            items = [compile_fast_node(e) for e in node.elts]
+            container = tuple if isinstance(node, ast.Tuple) else list
+            return lambda ns: container(i(ns) for i in items)
+
+        case ast.Call():
+            #only our pure functions, called by name
+            if (not isinstance(node.func, ast.Name)) or (node.func.id not in SAFE_FUNCTIONS):
+                raise UnsafeExpression("call")
+            if any(isinstance(a, ast.Starred) for a in node.args) or any(kw.arg is None for kw in node.keywords):
+                raise UnsafeExpression("unpacking")
+            #no callables, 'min(key=)' & 'max(key=)' are refused right away
+            if any(kw.arg=='key' for kw in node.keywords):
+                raise UnsafeExpression("key")
+            fct = SAFE_FUNCTIONS[node.func.id]
+            args = [compile_fast_node(a) for a in node.args]
+            kwargs = [(kw.arg, compile_fast_node(kw.value)) for kw in node.keywords]
+            return lambda ns: fct(*[safe_argument(a(ns)) for a in args], **{k:safe_argument(v(ns)) for k,v in kwargs})
+
+    raise UnsafeExpression(type(node).__name__)
+
+
+@lru_cache(maxsize=1024)
+def compile_fast_expression(expression:str,):
+    """compile a whitelisted expression into a closure taking the namespace, None if not supported"""
+
+    tree = parse_expression(expression)
+    if (tree is None):
+        return None
+
+    try:
+        return compile_fast_node(tree)
+    except (UnsafeExpression, KeyError):
+        return None
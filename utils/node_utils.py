@@ -3,17 +3,73 @@
 # SPDX-License-Identifier: GPL-2.0-or-later
 
 
-#TODO Optimization: node_utils function should check if value or type isn't already set before setting it.
-
-
 import bpy 
 
+import struct
+
 from math import hypot
 from mathutils import Vector
 
 from .draw_utils import get_dpifac
 
 
+#NOTE Every write to a socket value, label or type will tag the nodetree dirty and may trigger a new
+#     depsgraph_update_post signal, which will call our handlers again.. To break this feedback loop,
+#     our setters below always compare the values before writing them.
+#     We keep track of the skipped/applied writes, see the debug section of the addon preferences.
+
+WRITE_STATS = {'applied':0, 'skipped':0}
+
+
+def reset_write_stats():
+    """reset the counters of applied/skipped writes"""
+
+    WRITE_STATS['applied'] = WRITE_STATS['skipped'] = 0
+    return None
+
+
+def is_same_value(current, value):
+    """compare a blender property value with a python value. Blender store floats in single precision"""
+
+    if isinstance(value, str) or isinstance(current, str):
+        return current==value
+
+    if isinstance(value, bool) or isinstance(current, bool):
+        return bool(current)==bool(value)
+
+    if isinstance(value, float):
+        if (current==value):
+            return True
+        try:
+            return current==struct.unpack('f', struct.pack('f', value))[0]
+        except (OverflowError, TypeError, struct.error):
+            return False
+
+    if isinstance(value, int):
+        return current==value
+
+    #vectors, colors, arrays, matrices..
+    if hasattr(value, '__len__') and hasattr(current, '__len__'):
+        if (len(value)!=len(current)):
+            return False
+        return all(is_same_value(c,v) for c,v in zip(current,value))
+
+    #pointers, None..
+    return current==value
+
+
+def set_if_changed(owner, attr, value):
+    """set owner.attr = value only if the value differs, return True if written"""
+
+    if is_same_value(getattr(owner, attr), value):
+        WRITE_STATS['skipped'] += 1
+        return False
+
+    setattr(owner, attr, value)
+    WRITE_STATS['applied'] += 1
+    return True
+
+
 def get_node_absolute_location(node):
     """find the location of the node in global space"""
 
@@ -134,7 +190,7 @@ def set_socket_defvalue(ng, idx=None, socket=None, in_out='OUTPUT', value=None,
                     ng.links.new(defnod.outputs[0], socket)
                 #assign values
                 for inpt,val in zip(defnod.inputs, value):
-                    inpt.default_value = val
+                    set_if_changed(inpt, 'default_value', val)
 
             case 'MATRIX':
                 defnodname = f"DEFVAL{idx}_{socket.type}"
@@ -152,7 +208,7 @@ def set_socket_defvalue(ng, idx=None, socket=None, in_out='OUTPUT', value=None,
                     ng.links.new(defnod.outputs[0], socket)
                 #assign flatten values
                 for inpt,val in zip(defnod.inputs, [val for row in value for val in row] ):
-                    inpt.default_value = val
+                    set_if_changed(inpt, 'default_value', val)
 
             case _:
                 #we remove any unwanted links, if exists
@@ -160,7 +216,7 @@ def set_socket_defvalue(ng, idx=None, socket=None, in_out='OUTPUT', value=None,
                     for l in socket.links:
                         ng.links.remove(l)
                 #we set def value, simply..
-                socket.default_value = value
+                set_if_changed(socket, 'default_value', value)
 
     elif (in_out=='INPUT'):
         
@@ -175,7 +231,7 @@ def set_socket_defvalue(ng, idx=None, socket=None, in_out='OUTPUT', value=None,
         
         instancesocket = node.inputs[idx]
         if (instancesocket.type not in {'ROTATION','MATRIX'}):
-            instancesocket.default_value = value
+            set_if_changed(instancesocket, 'default_value', value)
             
     return None
 
@@ -186,7 +242,7 @@ def set_socket_label(ng, idx=None, in_out='OUTPUT', label=None, identifier=None,
     itm = get_socketui_from_socket(ng,
         idx=idx, in_out=in_out, identifier=identifier,
         )
-    itm.name = str(label)
+    set_if_changed(itm, 'name', str(label))
     return None  
 
 
@@ -205,7 +261,7 @@ def set_socket_type(ng, idx=None, in_out='OUTPUT', socket_type="NodeSocketFloat"
     itm = get_socketui_from_socket(ng,
         idx=idx, in_out=in_out, identifier=identifier,
         )
-    itm.socket_type = socket_type
+    set_if_changed(itm, 'socket_type', socket_type)
     
     #blender bug: you might need to use this return value because the original socket before change will be dirty.
     return get_socket_from_socketui(ng, itm, in_out=in_out)
@@ -259,7 +315,7 @@ def create_constant_input(ng, nodetype, value, identifier, location='auto', widt
 
     match nodetype:
         case 'ShaderNodeValue':
-            node.outputs[0].default_value = value
+            set_if_changed(node.outputs[0], 'default_value', value)
             return node.outputs[0]
         case _:
             raise Exception(f"{nodetype} Not Implemented Yet")
@@ -0,0 +1,183 @@
+# SPDX-FileCopyrightText: 2025 BD3D DIGITAL DESIGN (Dorian B.)
+#
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+
+#NOTE Built-in instrumentation of our handlers, of the 'update_all_instances' of each node class and of each node evaluation.
+#     Enabled from the addon preferences 'Profiling' option, costs a single dict lookup per call when disabled.
+#     We record the wall time of each call, the stats are viewable in the preferences, sorted by cost,
+#     and can be exported as JSON or as a Chrome trace (open it in 'chrome://tracing' or https://ui.perfetto.dev).
+
+
+import bpy
+
+import json
+import time
+
+from collections import deque
+from functools import wraps
+
+
+PROFILER = {'enabled':False, 'origin':time.perf_counter(),}
+PROFILE_SAMPLES_MAX = 1024            #durations kept per entry to compute the percentiles
+PROFILE_TRACE_MAX = 200_000           #max events kept for the chrome trace
+
+PROFILE_STATS = {}                    #{(category, name): {'count':int, 'total':float, 'max':float, 'samples':deque}}
+PROFILE_TRACE = deque(maxlen=PROFILE_TRACE_MAX)
+
+
+def set_profiling(enabled):
+    """enable or disable the recording of our timings"""
+
+    PROFILER['enabled'] = enabled
+    return None
+
+
+def reset_profile():
+    """clear all the recorded timings"""
+
+    PROFILE_STATS.clear()
+    PROFILE_TRACE.clear()
+    PROFILER['origin'] = time.perf_counter()
+    return None
+
+
+def record_timing(category, name, t0, t1,):
+    """store the duration of a call"""
+
+    duration = t1 - t0
+
+    entry = PROFILE_STATS.get((category, name))
+    if (entry is None):
+        entry = PROFILE_STATS[(category, name)] = {'count':0, 'total':0.0, 'max':0.0, 'samples':deque(maxlen=PROFILE_SAMPLES_MAX),}
+
+    entry['count'] += 1
+    entry['total'] += duration
+    entry['max'] = max(entry['max'], duration)
+    entry['samples'].append(duration)
+
+    PROFILE_TRACE.append((category, name, t0, duration))
+
+    return None
+
+
+class profile_scope():
+    """context manager timing the enclosed code, if profiling is enabled"""
+
+    __slots__ = ('category', 'name', 't0',)
+
+    def __init__(self, category, name,):
+        self.category = category
+        self.name = name
+        self.t0 = None
+
+    def __enter__(self):
+        if (PROFILER['enabled']):
+            self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        if (self.t0 is not None):
+            record_timing(self.category, self.name, self.t0, time.perf_counter(),)
+        return False
+
+
+def profiled(category,):
+    """decorator timing each call of a function, named after its qualified name"""
+
+    def decorator(fct):
+        name = fct.__qualname__
+
+        @wraps(fct)
+        def wrapper(*args, **kwargs):
+            if (not PROFILER['enabled']):
+                return fct(*args, **kwargs)
+            t0 = time.perf_counter()
+            try:
+                return fct(*args, **kwargs)
+            finally:
+                record_timing(category, name, t0, time.perf_counter(),)
+
+        return wrapper
+
+    return decorator
+
+
+def profiled_node(fct):
+    """decorator timing each call of a node method, named after the node instance"""
+
+    @wraps(fct)
+    def wrapper(self, *args, **kwargs):
+        if (not PROFILER['enabled']):
+            return fct(self, *args, **kwargs)
+        t0 = time.perf_counter()
+        try:
+            return fct(self, *args, **kwargs)
+        finally:
+            record_timing('node', f"{self.bl_label} '{self.name}' in '{self.id_data.name}'", t0, time.perf_counter(),)
+
+    return wrapper
+
+
+def get_percentile(sorted_samples, q,):
+    """nearest rank percentile of a sorted sequence"""
+
+    if (not sorted_samples):
+        return 0.0
+
+    idx = min(len(sorted_samples)-1, int(q * len(sorted_samples)))
+    return sorted_samples[idx]
+
+
+def get_profile_stats():
+    """get the stats of each recorded entry, sorted by total cost. durations in milliseconds"""
+
+    stats = []
+    for (category, name), entry in PROFILE_STATS.items():
+        samples = sorted(entry['samples'])
+        stats.append({
+            'category' : category,
+            'name' : name,
+            'count' : entry['count'],
+            'total' : entry['total'] * 1000,
+            'mean' : entry['total'] * 1000 / entry['count'],
+            'p50' : get_percentile(samples, 0.50) * 1000,
+            'p95' : get_percentile(samples, 0.95) * 1000,
+            'max' : entry['max'] * 1000,
+            })
+        continue
+
+    stats.sort(key=lambda s: s['total'], reverse=True)
+    return stats
+
+
+def export_profile_json(filepath,):
+    """write the stats to a json file"""
+
+    data = {
+        'blender' : bpy.app.version_string,
+        'blendfile' : bpy.data.filepath,
+        'unit' : 'ms',
+        'stats' : get_profile_stats(),
+        }
+
+    with open(filepath, 'w') as f:
+        json.dump(data, f, indent=2,)
+
+    return None
+
+
+def export_profile_chrome(filepath,):
+    """write the recorded calls to a chrome trace event file"""
+
+    origin = PROFILER['origin']
+    events = [
+        {'name':name, 'cat':category, 'ph':'X', 'pid':0, 'tid':0,
+         'ts':(t0-origin)*1_000_000, 'dur':duration*1_000_000,}
+        for category, name, t0, duration in PROFILE_TRACE
+        ]
+
+    with open(filepath, 'w') as f:
+        json.dump({'traceEvents':events, 'displayTimeUnit':'ms',}, f,)
+
+    return None
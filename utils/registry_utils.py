@@ -0,0 +1,151 @@
+# SPDX-FileCopyrightText: 2025 BD3D DIGITAL DESIGN (Dorian B.)
+#
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+
+#NOTE Registry of the live booster node instances, per node bl_idname.
+#     We do not keep direct references to the nodes themselves, as a python reference to a non-ID struct
+#     can dangle if its nodetree is removed. Instead we keep track of the nodetrees hosting the instances
+#     (ID references are safely invalidated by blender), and we gather the nodes from these trees only.
+#     The registry is kept up to date from the nodes init/copy/free, and rebuilt lazily after a
+#     file load or an undo/redo step (ID references are all invalidated in these cases).
+
+
+import bpy
+
+
+REGISTRY = {}                         #{bl_idname: {ng.session_uid: ng}}
+REGISTRY_STATE = {'dirty':True, 'ngcount':-1, 'version':0}    #version is incremented on each change
+SUPPRESSED = set()                    #{(ng.session_uid, node.name)} instances excluded from the handlers refresh
+
+
+def tag_registry_dirty():
+    """the registry will be rebuilt on next access"""
+
+    REGISTRY_STATE['dirty'] = True
+    SUPPRESSED.clear()
+    return None
+
+
+def rebuild_registry():
+    """scan all nodegroups once and gather the nodetrees hosting booster nodes"""
+
+    REGISTRY.clear()
+
+    for ng in bpy.data.node_groups:
+        for n in ng.nodes:
+            if ('NodeBooster' in n.bl_idname):
+                REGISTRY.setdefault(n.bl_idname, {})[ng.session_uid] = ng
+
+    REGISTRY_STATE['dirty'] = False
+    REGISTRY_STATE['ngcount'] = len(bpy.data.node_groups)
+    REGISTRY_STATE['version'] += 1
+
+    return None
+
+
+def ensure_registry():
+    """rebuild the registry if it was tagged dirty, or if nodegroups were added/removed behind our back (ex: append)"""
+
+    if (REGISTRY_STATE['dirty'] or (REGISTRY_STATE['ngcount']!=len(bpy.data.node_groups))):
+        rebuild_registry()
+
+    return None
+
+
+def get_registry_version():
+    """get a counter incremented on each change of the registry, useful to invalidate a resolved set of nodes"""
+
+    ensure_registry()
+    return REGISTRY_STATE['version']
+
+
+def register_instance(node):
+    """signal a new node instance, to be called from node init() & copy()"""
+
+    ng = node.id_data
+    if (ng is not None):
+        REGISTRY.setdefault(node.bl_idname, {})[ng.session_uid] = ng
+        REGISTRY_STATE['version'] += 1
+
+    return None
+
+
+def unregister_instance(node):
+    """signal a node instance removal, to be called from node free().
+    the node is still part of its nodetree at this point, we drop the host if it was the last instance in there"""
+
+    ng = node.id_data
+    if (ng is None):
+        return None
+
+    hosts = REGISTRY.get(node.bl_idname)
+    if (hosts is None or ng.session_uid not in hosts):
+        return None
+
+    if (not any((n!=node and n.bl_idname==node.bl_idname) for n in ng.nodes)):
+        del hosts[ng.session_uid]
+    REGISTRY_STATE['version'] += 1
+
+    return None
+
+
+def get_all_instances(bl_idname):
+    """return a list of all live node instances of given bl_idname"""
+
+    ensure_registry()
+
+    hosts = REGISTRY.get(bl_idname)
+    if (not hosts):
+        return []
+
+    instances = []
+    for uid, ng in list(hosts.items()):
+
+        try:
+            nodes = [n for n in ng.nodes if (n.bl_idname==bl_idname)]
+        except ReferenceError:
+            #the nodetree has been removed
+            del hosts[uid]
+            continue
+
+        #no more instances in there, we prune the host
+        if (not nodes):
+            del hosts[uid]
+            continue
+
+        instances += nodes
+        continue
+
+    return instances
+
+
+def get_instance_key(node):
+    """get a key identifying a node instance, safe to keep across event loop ticks"""
+
+    return (node.id_data.session_uid, node.name)
+
+
+def is_suppressed(node):
+    """check if a node instance is excluded from the handlers refresh"""
+
+    return bool(SUPPRESSED) and (get_instance_key(node) in SUPPRESSED)
+
+
+def suppress_instance(node, message="",):
+    """exclude a misbehaving node instance from the handlers refresh, warn the user"""
+
+    SUPPRESSED.add(get_instance_key(node))
+
+    print(f"WARNING: Node '{node.name}' of '{node.id_data.name}' is constantly updating the depsgraph and was suspended. {message}")
+    if hasattr(node, "error_message"):
+        node.error_message = f"Suspended, this node keeps updating the scene. {message}"
+
+    return None
+
+
+def release_instance(node):
+    """include a suspended node instance back into the handlers refresh"""
+
+    SUPPRESSED.discard(get_instance_key(node))
+    return None
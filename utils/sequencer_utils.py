@@ -0,0 +1,156 @@
+# SPDX-FileCopyrightText: 2025 BD3D DIGITAL DESIGN (Dorian B.)
+#
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+
+#NOTE Looking up the playing sound strips of each node, on each frame, is slow on large edits with hundreds of strips.
+#     Instead we keep an interval index of the sound strips of each scene: numpy arrays of their start/end frames,
+#     sorted by start. A frame query only touches the strips that are playing.
+#     The index stores a signature of what it caches: the name, channel, mute state & frame range of each sound strip.
+#     The signature is gathered on each access and compared, strips moved, trimmed, muted or renamed by any mean
+#     (operators don't always notify msgbus, scripts..) rebuild the index. Also rebuilt after undo/load.
+#     We only store strip names, strips are looked up when needed, python references to strips may dangle.
+
+
+import bpy
+
+import re
+import numpy as np
+
+from fnmatch import fnmatchcase
+
+
+SEQUENCER_INDEX = {}                  #{scene.session_uid: SoundStripIndex}
+
+
+class SoundStripIndex():
+    """sorted start/end arrays of the unmuted sound strips of a scene"""
+
+    def __init__(self, signature):
+
+        self.signature = signature
+
+        strips = [(name, channel, start, end) for name, channel, mute, start, end in signature if (not mute)]
+        strips.sort(key=lambda s: s[2])
+
+        self.names = [s[0] for s in strips]
+        self.starts = np.array([s[2] for s in strips], dtype=np.float64)
+        self.ends = np.array([s[3] for s in strips], dtype=np.float64)
+        self.channels = np.array([s[1] for s in strips], dtype=np.int64)
+
+        #the strips starting before a given strip may end after it, we need the running max of the ends
+        self.maxends = np.maximum.accumulate(self.ends) if len(strips) else self.ends
+
+    def query(self, frame, tail=0,):
+        """get the indices of the strips playing at given frame, ]start, end+tail["""
+
+        #only strips starting before the frame
+        count = int(np.searchsorted(self.starts, frame, side='left'))
+        if (count==0):
+            return np.zeros(0, dtype=np.int64)
+
+        #skip the leading strips that all ended already
+        first = int(np.searchsorted(self.maxends[:count], frame-tail, side='right'))
+
+        candidates = np.arange(first, count)
+        return candidates[(self.ends[first:count]+tail)>frame]
+
+    def query_range(self, frame_start, frame_end, tail=0,):
+        """get the indices of the strips playing at some point within [frame_start, frame_end]"""
+
+        count = int(np.searchsorted(self.starts, frame_end, side='left'))
+        candidates = np.arange(count)
+        return candidates[(self.ends[:count]+tail)>frame_start]
+
+
+def get_strips_signature(scene,):
+    """get the name, channel, mute state & frame range of the sound strips of a scene, everything our index caches"""
+
+    if (scene.sequence_editor is None):
+        return ()
+
+    return tuple((s.name, s.channel, s.mute, s.frame_final_start, s.frame_final_end)
+                 for s in scene.sequence_editor.sequences_all
+                 if (s.type=='SOUND') and (s.sound is not None))
+
+
+def tag_sequencer_index_dirty(scene=None,):
+    """the index of given scene, or of all scenes, will be rebuilt on next access"""
+
+    if (scene is None):
+        SEQUENCER_INDEX.clear()
+    else:
+        SEQUENCER_INDEX.pop(scene.session_uid, None)
+
+    return None
+
+
+def get_sequencer_index(scene,):
+    """get the sound strips index of a scene, build it if needed"""
+
+    signature = get_strips_signature(scene)
+
+    index = SEQUENCER_INDEX.get(scene.session_uid)
+    if (index is None) or (index.signature!=signature):
+        index = SEQUENCER_INDEX[scene.session_uid] = SoundStripIndex(signature)
+
+    return index
+
+
+def parse_channels(string,):
+    """parse a channel filter string such as '1, 3-5' into a set of ints. Invalid tokens are ignored"""
+
+    channels = set()
+    for token in re.split(r'[,;\s]+', string.strip()):
+        if ('-' in token):
+            a, _, b = token.partition('-')
+            if (a.isdigit() and b.isdigit()):
+                channels.update(range(int(a), int(b)+1))
+        elif (token.isdigit()):
+            channels.add(int(token))
+
+    return channels
+
+
+def filter_strips(index, indices, channels="", names="",):
+    """filter the given index strips by channel filter string & comma separated name patterns (fnmatch, case sensitive)"""
+
+    if (channels.strip()):
+        allowed = parse_channels(channels)
+        indices = [i for i in indices if (index.channels[i] in allowed)]
+
+    if (names.strip()):
+        patterns = [p.strip() for p in names.split(',') if p.strip()]
+        indices = [i for i in indices if any(fnmatchcase(index.names[i], p) for p in patterns)]
+
+    return indices
+
+
+def get_playing_strips(scene, frame, tail=0, channels="", names="",):
+    """get the sound strips playing at given frame, with optional channel & name filters"""
+
+    if (scene.sequence_editor is None):
+        return []
+
+    index = get_sequencer_index(scene)
+    indices = filter_strips(index, index.query(frame, tail=tail), channels=channels, names=names,)
+
+    sequences = scene.sequence_editor.sequences_all
+    strips = [sequences.get(index.names[i]) for i in indices]
+
+    return [s for s in strips if (s is not None)]
+
+
+def get_strips_in_range(scene, frame_start, frame_end, tail=0, channels="", names="",):
+    """get the sound strips playing within the given frame range, with optional channel & name filters"""
+
+    if (scene.sequence_editor is None):
+        return []
+
+    index = get_sequencer_index(scene)
+    indices = filter_strips(index, index.query_range(frame_start, frame_end, tail=tail), channels=channels, names=names,)
+
+    sequences = scene.sequence_editor.sequences_all
+    strips = [sequences.get(index.names[i]) for i in indices]
+
+    return [s for s in strips if (s is not None)]
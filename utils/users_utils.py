@@ -0,0 +1,124 @@
+# SPDX-FileCopyrightText: 2025 BD3D DIGITAL DESIGN (Dorian B.)
+#
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+
+#NOTE Reverse index of the objects using a nodegroup through their geometry nodes modifiers, nested groups included.
+#     Looping over all objects, modifiers & nodes on each evaluation is slow on large scenes, the index is rebuilt lazily when:
+#      - the file is loaded or an undo step is done (all ID references are invalidated).
+#      - objects or nodegroups are added or removed.
+#      - an updated object now uses other nodegroups in its modifiers, or an updated nodegroup nests other groups.
+#     We compare cheap signatures of the updated IDs only, see update_users_index().
+
+
+import bpy
+
+
+USERS_INDEX = {'dirty':True, 'counts':None, 'version':0, 'users':{}, 'modifiers':{}, 'groups':{},}
+#users: {ng.session_uid: {objects}}, modifiers: {obj.session_uid: (ng.session_uid,)}, groups: {ng.session_uid: (ng.session_uid,)}
+
+
+def get_modifiers_signature(obj):
+    """get the nodegroups used by the geometry nodes modifiers of an object"""
+
+    return tuple(m.node_group.session_uid for m in obj.modifiers if (m.type=='NODES' and m.node_group))
+
+
+def get_groups_signature(ng):
+    """get the nodegroups nested in a nodegroup"""
+
+    return tuple(sorted({n.node_tree.session_uid for n in ng.nodes if (n.type=='GROUP' and n.node_tree)}))
+
+
+def tag_users_index_dirty():
+    """the index will be rebuilt on next access"""
+
+    USERS_INDEX['dirty'] = True
+    return None
+
+
+def rebuild_users_index():
+    """gather the objects using each nodegroup, directly or nested"""
+
+    modifiers = USERS_INDEX['modifiers'] = {o.session_uid: get_modifiers_signature(o) for o in bpy.data.objects}
+    groups = USERS_INDEX['groups'] = {ng.session_uid: get_groups_signature(ng) for ng in bpy.data.node_groups}
+    users = USERS_INDEX['users'] = {}
+
+    for o in bpy.data.objects:
+
+        #walk down the nested groups, a group can be nested many times
+        stack = list(modifiers[o.session_uid])
+        visited = set()
+        while (stack):
+            uid = stack.pop()
+            if (uid in visited):
+                continue
+            visited.add(uid)
+            users.setdefault(uid, set()).add(o)
+            stack.extend(groups.get(uid, ()))
+            continue
+
+        continue
+
+    USERS_INDEX['dirty'] = False
+    USERS_INDEX['counts'] = (len(bpy.data.objects), len(bpy.data.node_groups))
+    USERS_INDEX['version'] += 1
+
+    return None
+
+
+def ensure_users_index():
+    """rebuild the index if it was tagged dirty, or if objects or nodegroups were added/removed"""
+
+    if (USERS_INDEX['dirty'] or (USERS_INDEX['counts']!=(len(bpy.data.objects), len(bpy.data.node_groups)))):
+        rebuild_users_index()
+
+    return None
+
+
+def get_users_index_version():
+    """get a counter incremented on each rebuild of the index, useful to invalidate results depending on the users"""
+
+    ensure_users_index()
+    return USERS_INDEX['version']
+
+
+def update_users_index(updated_ids):
+    """tag the index dirty if the given updated IDs changed their modifiers or nested groups"""
+
+    if (USERS_INDEX['dirty']):
+        return None
+
+    for id_data in updated_ids:
+
+        if isinstance(id_data, bpy.types.Object):
+            if (USERS_INDEX['modifiers'].get(id_data.session_uid, ())!=get_modifiers_signature(id_data)):
+                USERS_INDEX['dirty'] = True
+                return None
+
+        elif isinstance(id_data, bpy.types.NodeTree):
+            if (USERS_INDEX['groups'].get(id_data.session_uid, ())!=get_groups_signature(id_data)):
+                USERS_INDEX['dirty'] = True
+                return None
+
+        continue
+
+    return None
+
+
+def get_nodetree_users(ng):
+    """get the objects using the given nodegroup through their geometry nodes modifiers, nested groups included"""
+
+    ensure_users_index()
+
+    users = set()
+    for o in USERS_INDEX['users'].get(ng.session_uid, ()):
+        try:
+            o.name
+        except ReferenceError:
+            #the object has been removed meanwhile
+            continue
+        users.add(o)
+        continue
+
+    return users